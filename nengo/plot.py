@@ -32,7 +32,12 @@ class Pygame(object):
                     pygame.display.set_mode(e.dict['size'],
                                 pygame.OPENGL | pygame.DOUBLEBUF | 
                                 pygame.RESIZABLE)
-                                            
+                    self.plot.invalidate()
+
+            if not self.plot.needs_paint():
+                # nothing has changed, so don't spin
+                pygame.time.wait(10)
+                continue
 
             self.plot.paint()
             pygame.display.flip()
@@ -42,18 +47,41 @@ class Pygame(object):
 
 class Plot(object):
     def __init__(self):
-        pass
-    
+        self.dirty = True   # whether the window needs repainting
+
+    def invalidate(self):
+        """Ask for the plot to be painted again."""
+        self.dirty = True
+
+    def needs_paint(self):
+        """Whether paint would change anything (override as needed)."""
+        return True
+
     def show(self, manager=Pygame, width=600, height=600):
         wm = manager(plot=self, width=width, height=height)
 
 
 class SparklePlot(Plot):
-    def __init__(self, grid_width, grid_height, decay_rate=0.9):
+    def __init__(self, grid_width, grid_height, decay_rate=0.9,
+                 spikes_per_frame=100, threshold=1/256.):
         super(SparklePlot, self).__init__()
         self.grid_width = grid_width
         self.grid_height = grid_height
         self.decay_rate = decay_rate
+        # random spikes to draw every frame, for testing
+        self.spikes_per_frame = spikes_per_frame
+        self.queue = []             # spikes waiting to be drawn
+        self.level = 0.0            # how bright the brightest texel can be
+        self.threshold = threshold  # brightness below which nothing shows
+
+    def add_spikes(self, data):
+        """Queue an array of neuron indexes to be drawn."""
+        self.queue.append(data)
+
+    def needs_paint(self):
+        # keep going until everything has faded away
+        return (self.dirty or len(self.queue) > 0 or
+                self.spikes_per_frame > 0 or self.level >= self.threshold)
 
     def init(self):
         # program for drawing spikes
@@ -72,13 +100,20 @@ class SparklePlot(Plot):
         # fade out the sparkle plot
         self.fader.swap_frame_buffer()
         self.fader.paint_faded(decay=self.decay_rate)
+        self.level *= self.decay_rate
+        self.dirty = False
 
-        spikes_per_frame = 100
-        data = np.random.randint(self.grid_width * self.grid_height,
-                                 size=spikes_per_frame)
+        queue, self.queue = self.queue, []
+        if self.spikes_per_frame > 0:
+            queue.append(np.random.randint(
+                self.grid_width * self.grid_height,
+                size=self.spikes_per_frame))
 
         # paint the spikes onto the sparkle plot
-        self.spiker.paint_spikes(data)
+        for data in queue:
+            if len(data) > 0:
+                self.spiker.paint_spikes(data)
+                self.level = 1.0    # the texture saturates at 1
 
         # switch to rendering on the screen
         gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
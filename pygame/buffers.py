@@ -0,0 +1,60 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+class StreamBuffer(object):
+    """A growable GL buffer that is reused for streaming data every frame.
+
+    Rather than creating a new VBO for each frame, data is written into
+    one preallocated buffer at a moving write cursor.  When the buffer
+    fills up it is orphaned (re-specified with no data) so the driver can
+    hand us fresh memory without waiting for pending draws, and the
+    cursor starts again at the beginning.
+    """
+    def __init__(self, capacity=1 << 16, target=gl.GL_ARRAY_BUFFER):
+        self.target = target
+        self.capacity = capacity    # size of the buffer in bytes
+        self.cursor = 0             # byte offset of the next write
+        self.buffer = gl.glGenBuffers(1)
+        self.bind()
+        gl.glBufferData(self.target, self.capacity, None, gl.GL_STREAM_DRAW)
+
+    def bind(self, target=None):
+        gl.glBindBuffer(self.target if target is None else target,
+                        self.buffer)
+
+    def orphan(self):
+        """Give the old storage back to the driver and start over."""
+        gl.glBufferData(self.target, self.capacity, None, gl.GL_STREAM_DRAW)
+        self.cursor = 0
+
+    def write(self, data):
+        """Copy the data into the buffer and return its byte offset.
+
+        The buffer is left bound, so the returned offset can be passed
+        straight on to glVertexAttribPointer or glDrawElements.
+        """
+        data = np.ascontiguousarray(data)
+        nbytes = data.nbytes
+
+        self.bind()
+        if nbytes > self.capacity:
+            # grow geometrically so we don't reallocate every frame
+            self.capacity = max(nbytes, 2 * self.capacity)
+            self.orphan()
+        elif self.cursor + nbytes > self.capacity:
+            self.orphan()
+
+        offset = self.cursor
+        gl.glBufferSubData(self.target, offset, nbytes, data)
+
+        # keep every write 4-byte aligned for the vertex fetcher
+        self.cursor = (offset + nbytes + 3) & ~3
+        return offset
+
+    @staticmethod
+    def pointer(offset):
+        """Convert a byte offset into the form PyOpenGL expects."""
+        return ctypes.c_void_p(offset)
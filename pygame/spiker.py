@@ -1,6 +1,7 @@
+import numpy as np
 import OpenGL.GL as gl
-import OpenGL.arrays.vbo as glvbo
 
+import buffers
 import gl_program
 
 
@@ -47,19 +48,27 @@ class SpikeProgram(gl_program.GLProgram):
             }
             """
 
+    def initialize(self):
+        # a single buffer reused for streaming the spikes every frame
+        self.buffer = buffers.StreamBuffer()
+
     def paint_spikes(self, data, scale=1.0):
         """Render the given array of neuron indexes."""
 
-        # convert the data to a VBO
-        vbo = glvbo.VBO(data)
-        vbo.bind()
+        # the shader reads 32-bit ints
+        data = np.asarray(data)
+        if data.dtype.itemsize != 4:
+            data = data.astype(np.uint32)
+
+        # copy the data into the streaming buffer
+        offset = self.buffer.write(data)
 
         # tell OpenGL that the VBO contains an array of vertices
         gl.glEnableVertexAttribArray(0)
 
         # array is a list of unsigned ints
         gl.glVertexAttribPointer(0, 1, gl.GL_UNSIGNED_INT,
-                                 gl.GL_FALSE, 0, None)
+                                 gl.GL_FALSE, 0, self.buffer.pointer(offset))
 
         # activate the program
         gl.glUseProgram(self.program)
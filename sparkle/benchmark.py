@@ -0,0 +1,185 @@
+"""Profile the per-frame cost of drawing spikes.
+
+Runs a fixed number of frames of the fade/spike/draw loop and prints the
+time per frame along with the most expensive calls, so different ways of
+getting spikes to the GPU can be compared.
+
+    python benchmark.py [mode] [grid size ...]
+
+where mode is 'vbo' (a new VBO every frame, the old behaviour),
+'stream' (the reusable StreamBuffer), 'persistent' (the persistently
+mapped PersistentStreamBuffer), 'synthetic' (spikes generated on the
+GPU, so nothing is uploaded at all), 'compute' / 'compute_binary'
+(spikes scattered by a compute shader rather than drawn as points), or
+'window' (exact counts over the last window_frames frames from
+WindowCountProgram, instead of fading).
+Each grid size is the side of a square grid; for example
+
+    python benchmark.py compute 64 256 1024 4096
+
+To try it on Mesa's software renderer, set LIBGL_ALWAYS_SOFTWARE=1.
+"""
+import cProfile
+import pstats
+import sys
+import time
+
+from PyQt4 import QtGui, QtCore, QtOpenGL
+from PyQt4.QtOpenGL import QGLWidget
+import OpenGL.GL as gl
+import OpenGL.arrays.vbo as glvbo
+import numpy as np
+
+import spiker
+import fader
+import window
+import draw_texture
+import qt_helpers
+
+grid_sizes = [4096]
+activity = 0.06     # fraction of neurons spiking each frame
+n_frames = 100
+decay_rate = 0.9
+synthetic_dt = 0.001
+window_frames = 10
+
+
+def paint_spikes_vbo(program, data, scale=1.0):
+    """The old paint_spikes, which allocates a new VBO every frame."""
+    vbo = glvbo.VBO(data, target=gl.GL_ELEMENT_ARRAY_BUFFER)
+    vbo.bind()
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, program.layout)
+    gl.glEnableVertexAttribArray(0)
+    gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+    gl.glUseProgram(program.program)
+    gl.glUniform1f(program.scale, scale)
+    gl.glEnable(gl.GL_BLEND)
+    gl.glBlendEquationSeparate(gl.GL_FUNC_ADD, gl.GL_FUNC_ADD)
+    gl.glBlendFuncSeparate(gl.GL_ONE, gl.GL_ONE,
+                           gl.GL_ZERO, gl.GL_ONE)
+    gl.glDrawElements(gl.GL_POINTS, len(data), gl.GL_UNSIGNED_INT, None)
+    gl.glDisable(gl.GL_BLEND)
+
+
+class GLBenchmarkWidget(QGLWidget):
+    # default window size
+    width, height = 600, 600
+
+    def __init__(self, mode, sizes):
+        self.mode = mode
+        self.sizes = list(sizes)
+        self.frame = 0
+        super(GLBenchmarkWidget, self).__init__()
+
+    def initializeGL(self):
+        self.start_run()
+
+    def start_run(self):
+        """Set everything up for the next grid size."""
+        size = self.sizes.pop(0)
+        self.sparkle_width = self.sparkle_height = size
+        n_neurons = size * size
+        self.spikes_per_frame = int(activity * n_neurons)
+
+        backend = 'points'
+        if self.mode.startswith('compute'):
+            backend = self.mode
+        self.spiker = spiker.SpikeProgram(size, size,
+                                          persistent=self.mode == 'persistent',
+                                          backend=backend)
+        self.spiker.link()
+        self.fader = fader.FadeProgram(size, size)
+        self.fader.link()
+        if self.mode == 'window':
+            self.window = window.WindowCountProgram(size, size,
+                                                    window_frames)
+            self.window.link()
+        self.draw_texture = draw_texture.DrawTextureProgram()
+        self.draw_texture.link()
+
+        # generate the spikes up front so the RNG isn't in the profile
+        self.data = np.random.randint(n_neurons,
+                                      size=self.spikes_per_frame)
+        if self.mode == 'vbo':
+            # the old path only draws 32-bit indexes
+            self.data = self.data.astype(np.uint32)
+        else:
+            self.data = self.data.astype(self.spiker.index_dtype)
+
+        # choose a rate that gives about the same number of spikes
+        if self.mode == 'synthetic':
+            rate = -np.log(1 - activity) / synthetic_dt
+            self.spiker.set_rate_map(rate)
+
+        self.frame = 0
+        self.profile = cProfile.Profile()
+
+    def paint_frame(self):
+        if self.mode == 'window':
+            # count the spikes over the window rather than fading
+            self.window.begin_frame()
+            self.spiker.paint_spikes(self.data)
+            self.window.end_frame()
+            texture = self.window.get_current_texture()
+            gain = 1.0 / window_frames
+        else:
+            self.fader.swap_frame_buffer()
+            self.fader.paint_faded(decay=decay_rate)
+
+            if self.mode == 'vbo':
+                paint_spikes_vbo(self.spiker, self.data)
+            elif self.mode == 'synthetic':
+                self.spiker.paint_synthetic(synthetic_dt)
+            else:
+                self.spiker.paint_spikes(self.data)
+            texture = self.fader.get_current_texture()
+            gain = 1.0
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        gl.glViewport(0, 0, self.width, self.height)
+        self.draw_texture.paint(texture, gain=gain)
+
+        # wait for the GPU so we measure the whole frame
+        gl.glFinish()
+
+    def paintGL(self):
+        if self.frame == 0:
+            self.t_start = time.time()
+        self.profile.runcall(self.paint_frame)
+        self.frame += 1
+
+        if self.frame < n_frames:
+            self.update()
+            return
+
+        dt = time.time() - self.t_start
+        print '%s %dx%d: %g ms per frame, %g Mspikes per second' % (
+            self.mode, self.sparkle_width, self.sparkle_height,
+            dt * 1000.0 / n_frames,
+            n_frames * self.spikes_per_frame * 0.000001 / dt)
+        pstats.Stats(self.profile).sort_stats('cumulative').print_stats(10)
+
+        if len(self.sizes) > 0:
+            self.start_run()
+            self.update()
+        else:
+            QtGui.QApplication.instance().quit()
+
+    def resizeGL(self, width, height):
+        """Called upon window resizing: reinitialize the viewport."""
+        self.width, self.height = width, height
+        gl.glViewport(0, 0, width, height)
+
+if __name__ == '__main__':
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'stream'
+    sizes = [int(x) for x in sys.argv[2:]] or grid_sizes
+
+    class TestWindow(QtGui.QMainWindow):
+        def __init__(self):
+            super(TestWindow, self).__init__()
+            self.widget = GLBenchmarkWidget(mode, sizes)
+            self.setGeometry(100, 100, self.widget.width, self.widget.height)
+            self.setCentralWidget(self.widget)
+            self.show()
+
+    win = qt_helpers.create_window(TestWindow)
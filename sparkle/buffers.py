@@ -0,0 +1,195 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+import OpenGL.extensions
+
+
+class StreamBuffer(object):
+    """A growable GL buffer that is reused for streaming data every frame.
+
+    Rather than creating a new VBO for each frame, data is written into
+    one preallocated buffer at a moving write cursor.  When the buffer
+    fills up it is orphaned (re-specified with no data) so the driver can
+    hand us fresh memory without waiting for pending draws, and the
+    cursor starts again at the beginning.
+    """
+    def __init__(self, capacity=1 << 16, target=gl.GL_ARRAY_BUFFER):
+        self.target = target
+        self.capacity = capacity    # size of the buffer in bytes
+        self.cursor = 0             # byte offset of the next write
+        self.buffer = gl.glGenBuffers(1)
+        self.bind()
+        gl.glBufferData(self.target, self.capacity, None, gl.GL_STREAM_DRAW)
+
+    def bind(self, target=None):
+        gl.glBindBuffer(self.target if target is None else target,
+                        self.buffer)
+
+    def orphan(self):
+        """Give the old storage back to the driver and start over."""
+        gl.glBufferData(self.target, self.capacity, None, gl.GL_STREAM_DRAW)
+        self.cursor = 0
+
+    def reserve(self, nbytes):
+        """Make sure the next writes totalling nbytes go in one piece.
+
+        Use this before writing several arrays that are drawn together,
+        so that orphaning can't discard the earlier ones.
+        """
+        self.bind()
+        if nbytes > self.capacity:
+            self.capacity = max(nbytes, 2 * self.capacity)
+            self.orphan()
+        elif self.cursor + nbytes > self.capacity:
+            self.orphan()
+
+    def write(self, data):
+        """Copy the data into the buffer and return its byte offset.
+
+        The buffer is left bound, so the returned offset can be passed
+        straight on to glVertexAttribPointer or glDrawElements.
+        """
+        data = np.ascontiguousarray(data)
+        nbytes = data.nbytes
+
+        # grows geometrically so we don't reallocate every frame
+        self.reserve(nbytes)
+
+        offset = self.cursor
+        gl.glBufferSubData(self.target, offset, nbytes, data)
+
+        # keep every write 4-byte aligned for the vertex fetcher
+        self.cursor = (offset + nbytes + 3) & ~3
+        return offset
+
+    @staticmethod
+    def pointer(offset):
+        """Convert a byte offset into the form PyOpenGL expects."""
+        return ctypes.c_void_p(offset)
+
+
+class PersistentStreamBuffer(object):
+    """A streaming buffer that stays mapped into our address space.
+
+    Uses GL 4.4 (ARB_buffer_storage) persistent, coherent mapping, so
+    data is copied straight into GPU-visible memory by numpy without
+    going through PyOpenGL's array conversion.  The buffer is split into
+    regions that are used in turn; a fence is placed when we move off a
+    region, and we wait on it before writing to that region again, so we
+    never overwrite data the GPU hasn't drawn yet.
+
+    It has the same interface as StreamBuffer.
+    """
+    FLAGS = (gl.GL_MAP_WRITE_BIT | gl.GL_MAP_PERSISTENT_BIT |
+             gl.GL_MAP_COHERENT_BIT)
+
+    def __init__(self, capacity=1 << 16, target=gl.GL_ARRAY_BUFFER,
+                 regions=3):
+        self.target = target
+        self.regions = regions
+        self.buffer = None
+        self.allocate(capacity)
+
+    @staticmethod
+    def available():
+        """Whether the current context supports persistent mapping.
+
+        PyOpenGL finds a glBufferStorage entry point on most drivers
+        whatever version of context we have (Qt4 gives us a 2.1 or 3.0
+        one), so we ask the context itself: it needs GL 4.4 or the
+        ARB_buffer_storage extension.
+        """
+        if not gl.glBufferStorage:
+            return False
+        if OpenGL.extensions.hasGLExtension('GL_ARB_buffer_storage'):
+            return True
+        version = gl.glGetString(gl.GL_VERSION).decode('ascii')
+        major, minor = version.split()[0].split('.')[:2]
+        return (int(major), int(minor)) >= (4, 4)
+
+    def allocate(self, capacity):
+        """(Re)create the buffer with regions of the given size."""
+        if self.buffer is not None:
+            # make sure nothing is still reading the old buffer
+            for fence in self.fences:
+                self.wait(fence)
+            self.bind()
+            gl.glUnmapBuffer(self.target)
+            gl.glDeleteBuffers(1, [self.buffer])
+
+        self.capacity = capacity    # size of each region in bytes
+        self.fences = [None] * self.regions
+        self.region = 0             # which region we are writing to
+        self.cursor = 0             # byte offset of the next write
+
+        size = self.capacity * self.regions
+        self.buffer = gl.glGenBuffers(1)
+        self.bind()
+        gl.glBufferStorage(self.target, size, None, self.FLAGS)
+        address = gl.glMapBufferRange(self.target, 0, size, self.FLAGS)
+        address = ctypes.cast(address, ctypes.c_void_p).value
+        self.memory = np.frombuffer((ctypes.c_ubyte * size).from_address(
+            address), dtype=np.uint8)
+
+    def bind(self, target=None):
+        gl.glBindBuffer(self.target if target is None else target,
+                        self.buffer)
+
+    @staticmethod
+    def wait(fence):
+        """Block until the GPU has passed the given fence."""
+        if fence is None:
+            return
+        while gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT,
+                                  1000000) == gl.GL_TIMEOUT_EXPIRED:
+            pass
+        gl.glDeleteSync(fence)
+
+    def next_region(self):
+        """Fence off the current region and move on to the next one."""
+        self.fences[self.region] = gl.glFenceSync(
+            gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.region = (self.region + 1) % self.regions
+        self.wait(self.fences[self.region])
+        self.fences[self.region] = None
+        self.cursor = self.region * self.capacity
+
+    def reserve(self, nbytes):
+        """Make sure the next writes totalling nbytes go in one piece."""
+        self.bind()
+        if nbytes > self.capacity:
+            self.allocate(max(nbytes, 2 * self.capacity))
+        elif self.cursor + nbytes > (self.region + 1) * self.capacity:
+            self.next_region()
+
+    def array(self, shape, dtype):
+        """Reserve space and return (offset, array) to be filled in place.
+
+        The array is a view onto the mapped memory, so anything numpy
+        writes into it goes straight to the GPU.
+        """
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        self.reserve(nbytes)
+        offset = self.cursor
+        self.cursor = (offset + nbytes + 3) & ~3
+        view = self.memory[offset:offset + nbytes].view(dtype)
+        return offset, view.reshape(shape)
+
+    def write(self, data):
+        """Copy the data into the buffer and return its byte offset."""
+        data = np.asarray(data)
+        offset, view = self.array(data.shape, data.dtype)
+        view[...] = data
+        return offset
+
+    pointer = staticmethod(StreamBuffer.pointer)
+
+
+def create_stream_buffer(capacity=1 << 16, target=gl.GL_ARRAY_BUFFER,
+                         persistent=True):
+    """Make the best streaming buffer the GL implementation supports."""
+    if persistent and PersistentStreamBuffer.available():
+        return PersistentStreamBuffer(capacity, target)
+    return StreamBuffer(capacity, target)
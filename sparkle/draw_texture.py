@@ -5,12 +5,60 @@ import OpenGL.arrays.vbo as glvbo
 import gl_program
 
 
+def channel_mix(channel):
+    """A colour matrix that shows one channel (0 to 3) as grey."""
+    mix = np.diag([0., 0., 0., 1.])
+    mix[:3, channel] = 1.
+    return mix
+
+
+def false_color_mix(colors):
+    """A colour matrix that shows each channel in its own colour.
+
+    colors is a list of up to four RGB colours, for the R, G, B and A
+    channels in turn, and the results are added together.
+    """
+    mix = np.diag([0., 0., 0., 1.])
+    for channel, color in enumerate(colors):
+        mix[:3, channel] = color
+    return mix
+
+
 class DrawTextureProgram(gl_program.GLProgram):
-    """A simple program that draws a given texture to the full viewport."""
+    """A simple program that draws a given texture to the full viewport.
+
+    In lazy mode the texture is one from a lazy FadeProgram, holding the
+    time of the last spike in alpha, and each texel is drawn faded by
+    exp(-(now - t_last) / tau).
 
-    def __init__(self):
+    If a colormap is given (an array of RGB or RGBA colours, from 0 to
+    1), the red channel is drawn through it rather than as grey.
+
+    The texture can be shifted sideways by an offset (in texture
+    coordinates), which wraps around for textures set to GL_REPEAT.
+
+    Each texel is multiplied by a 4x4 colour matrix before it is drawn,
+    which can pick out or combine channels (see channel_mix,
+    false_color_mix and FadeProgram.display_mix).
+    """
+
+    def __init__(self, lazy=False, colormap=None):
+        self.lazy = lazy
+        self.colormap_colors = colormap
+        self.colormap_texture = None
         # external input indicating which texture index to use
         self.texture1 = gl_program.GLUniform()
+        # brightness multiplier, for textures that hold counts above 1
+        self.gain = gl_program.GLUniform()
+        # the current time and decay time constant, for lazy mode
+        self.now = gl_program.GLUniform()
+        self.tau = gl_program.GLUniform()
+        # the colormap texture, if there is one
+        self.colormap = gl_program.GLUniform()
+        # the colour matrix
+        self.color_mix = gl_program.GLUniform()
+        # how far to shift the texture sideways
+        self.offset = gl_program.GLUniform()
         super(DrawTextureProgram, self).__init__()
 
     def vertex_shader(self):
@@ -25,18 +73,40 @@ class DrawTextureProgram(gl_program.GLProgram):
             }
             """
     def fragment_shader(self):
+        if self.lazy:
+            # fade the color by the time since the last spike, which is
+            # kept in alpha
+            color = ('vec4(c.rgb * (gain * exp(-max(now - c.a, 0.) / tau)),'
+                     ' 1.)')
+        else:
+            color = 'c * gain'
+        color = 'color_mix * %s' % color
+        if self.colormap_colors is not None:
+            # look the brightness up in the colormap
+            color = 'texture1D(colormap, clamp((%s).r, 0., 1.))' % color
         return """#version 110
             uniform sampler2D texture1;
+            uniform sampler1D colormap;
+            uniform mat4 color_mix;
+            uniform float gain;
+            uniform float now;
+            uniform float tau;
+            uniform float offset;
 
             // set the color based on the texture coordinates in the
             // given texture
             void main()
             {
-                gl_FragColor = texture2D(texture1, gl_TexCoord[0].st);
+                vec4 c = texture2D(texture1,
+                                   gl_TexCoord[0].st + vec2(offset, 0.));
+                gl_FragColor = %s;
             }
-            """
+            """ % color
 
     def initialize(self):
+        if self.colormap_colors is not None:
+            self.set_colormap(self.colormap_colors)
+
         # rendering this square will fill the whole screen
         # values are x,y,z,u,v  (vertex, texture coordinates)
 
@@ -51,8 +121,33 @@ class DrawTextureProgram(gl_program.GLProgram):
             ],'f')
         )
 
-    def paint(self, texture):
-        """Draw the given texture at full screen."""
+    def set_colormap(self, colors):
+        """Upload the colormap as a 1D texture, interpolated linearly."""
+        colors = np.asarray(colors, dtype='f')
+        pixel_format = gl.GL_RGBA if colors.shape[1] == 4 else gl.GL_RGB
+        self.colormap_colors = colors
+        if self.colormap_texture is None:
+            self.colormap_texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_1D, self.colormap_texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_1D, gl.GL_TEXTURE_MIN_FILTER,
+                           gl.GL_LINEAR)
+        gl.glTexParameteri(gl.GL_TEXTURE_1D, gl.GL_TEXTURE_MAG_FILTER,
+                           gl.GL_LINEAR)
+        gl.glTexParameterf(gl.GL_TEXTURE_1D, gl.GL_TEXTURE_WRAP_S,
+                           gl.GL_CLAMP_TO_EDGE)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+        gl.glTexImage1D(gl.GL_TEXTURE_1D, 0, gl.GL_RGBA, len(colors), 0,
+                        pixel_format, gl.GL_FLOAT, colors)
+
+    def paint(self, texture, gain=1.0, now=0.0, tau=1.0, mix=None,
+              offset=0.0):
+        """Draw the given texture at full screen.
+
+        now and tau are only used in lazy mode.  mix is the colour matrix,
+        which defaults to the identity.
+        """
+        if mix is None:
+            mix = np.eye(4)
 
         # make sure we can use VBOs
         gl.glEnableVertexAttribArray(0)
@@ -62,11 +157,23 @@ class DrawTextureProgram(gl_program.GLProgram):
 
         # indicate the texture will be set by GL_TEXTURE0
         gl.glUniform1i(self.texture1, 0)
+        gl.glUniform1f(self.gain, gain)
+        gl.glUniform1f(self.offset, offset)
+        gl.glUniformMatrix4fv(self.color_mix, 1, gl.GL_TRUE,
+                              np.asarray(mix, dtype='f'))
+        if self.lazy:
+            gl.glUniform1f(self.now, now)
+            gl.glUniform1f(self.tau, tau)
 
         # turn on texture mapping and bind to the given texture
         gl.glEnable(gl.GL_TEXTURE_2D)
         gl.glActiveTexture(gl.GL_TEXTURE0)
         gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        if self.colormap_colors is not None:
+            gl.glUniform1i(self.colormap, 1)    # and GL_TEXTURE1
+            gl.glActiveTexture(gl.GL_TEXTURE1)
+            gl.glBindTexture(gl.GL_TEXTURE_1D, self.colormap_texture)
+            gl.glActiveTexture(gl.GL_TEXTURE0)
 
         # activate the square to be rendered
         self.square.bind()
@@ -1,8 +1,40 @@
+import time
+
 import numpy as np
 import OpenGL.GL as gl
 import OpenGL.arrays.vbo as glvbo
 
+import buffers
 import gl_program
+import render_target
+
+
+# a clock that never jumps backwards, where we have one
+clock = getattr(time, 'monotonic', time.time)
+
+# the fragment shader code for each decay kernel, given the old colour c,
+# the decay exp(-dt / tau) and elapsed = dt / tau (one for each channel)
+KERNELS = dict(
+    exponential="""
+                // decay it a bit
+                gl_FragColor = c * decay;""",
+    linear="""
+                // ramp it down to zero over tau
+                gl_FragColor = max(c - elapsed, 0.);""",
+    alpha="""
+                // G holds w, which decays and drives x, and R holds x + w
+                // so that spikes add to w; x is then (t / tau) exp(-t / tau)
+                float w = c.g;
+                float x = (c.r - w + elapsed.r * w) * decay.r;
+                w *= decay.r;
+                gl_FragColor = vec4(x + w, w, c.ba * decay.ba);""",
+    hold="""
+                // G is how much of the hold time is left, and R and B are
+                // 1 until it runs out
+                float g = min(c.g, 1.) - elapsed.r;
+                float h = g > 0. ? 1. : 0.;
+                gl_FragColor = vec4(h, max(g, 0.), h, c.a);""",
+    )
 
 
 class FadeProgram(gl_program.GLProgram):
@@ -11,13 +43,87 @@ class FadeProgram(gl_program.GLProgram):
     Contains two textures, and renders one onto the other, but slightly
     darker.  Each frame you can indicate how much darker to go using the
     decay uniform variable.
+
+    The textures are GL_RGBA by default, which clamps at 1.  Pass a float
+    internal_format (e.g. GL_RGBA16F or GL_RGBA32F) to let weighted or
+    coincident spikes accumulate past 1.  Since the plot only has one
+    intensity, a single-channel GL_R8, GL_R16F or GL_R32F texture does
+    the same job in a quarter of the memory and fill bandwidth, and the
+    float ones keep long decay tails from rounding away to zero.
+
+    If a time constant tau (in seconds) is given, the decay is worked out
+    from the time since the last frame as exp(-dt / tau), so the plot
+    fades at the same speed whatever the frame rate.  tau can also be a
+    list of up to four time constants, one for each of the R, G, B and A
+    channels (the last one is used for any channels left over), so one
+    set of spikes can be shown fading at several speeds at once; see
+    channel_mix and false_color_mix in draw_texture.  Spikes only add to
+    alpha if the SpikeProgram has blend_alpha set.
+
+    In lazy mode nothing is faded at all.  A single GL_RGBA32F texture
+    keeps the weight of each neuron's last spike in RGB and its time in
+    alpha (the spikes are drawn with a timestamp), and the
+    brightness exp(-(now - t_last) / tau) is worked out when the texture
+    is drawn (see DrawTextureProgram's lazy mode).  The cost per frame is
+    then proportional to the number of spikes rather than the grid area.
+
+    In in_place mode there is also just one texture, and it is faded
+    where it is by drawing a square over it with the blend colour set to
+    the decay (GL_ZERO, GL_CONSTANT_COLOR), so the old frame never has to
+    be read through a texture.
+
+    If a TileTracker is given (shared with the SpikeProgram, which marks
+    the tiles that get spikes), only the tiles that have had a spike in
+    the last tau * log(1 / threshold) seconds are faded, and the others
+    are cleared once when they go quiet.  This needs tau.
+
+    The kernel chooses how a spike fades away (see KERNELS): 'exponential'
+    (the default), 'linear' (down to nothing over tau), 'alpha' (rising to
+    a peak at tau, then decaying) or 'hold' (on for tau, then off).  Each
+    kernel is a separate shader, and the programs are shared between
+    faders.  The others need the ping-pong mode, and 'alpha' and 'hold'
+    keep state in the green channel, so they need an RGBA texture and
+    should be drawn through display_mix(); a float texture keeps the
+    small steps of 'linear' and 'hold' from rounding away.
     """
-    def __init__(self, width, height):
+    cache_programs = True
+
+    def __init__(self, width, height, internal_format=gl.GL_RGBA, tau=None,
+                 lazy=False, in_place=False, tiles=None, threshold=1/256.,
+                 kernel='exponential'):
         self.width = width
         self.height = height
+        self.lazy = lazy
+        self.in_place = in_place
+        self.single = lazy or in_place  # only one texture, never swapped
+        if lazy:
+            internal_format = gl.GL_RGBA32F     # room for the timestamps
+        self.internal_format = internal_format
+        if kernel not in KERNELS:
+            raise ValueError('Unknown kernel %r' % kernel)
+        if kernel != 'exponential' and self.single:
+            raise ValueError('The %s kernel needs two textures' % kernel)
+        if (kernel in ('alpha', 'hold') and
+                internal_format in gl_program.SINGLE_CHANNEL_FORMATS):
+            raise ValueError('The %s kernel needs an RGBA texture' % kernel)
+        self.kernel = kernel
+        if tau is not None and np.ndim(tau) > 0:
+            tau = gl_program.channel_taus(tau)
+            if internal_format in gl_program.SINGLE_CHANNEL_FORMATS or lazy:
+                raise ValueError('Time constants per channel need an RGBA '
+                                 'texture')
+        self.tau = tau              # time constant of the decay
+        self.tiles = tiles          # which tiles need fading
+        self.threshold = threshold  # brightness below which nothing shows
+        if tiles is not None and tau is None:
+            raise ValueError('Tracking tiles needs a time constant tau')
+        self.start_time = clock()   # timestamps are relative to this
+        self.last_time = None       # when we last faded
+        self.dt = None              # time covered by the last fade
+        self.quiet_time = None      # when everything will have faded
         self.texture1 = gl_program.GLUniform()  # which texture core to use
         self.decay = gl_program.GLUniform()     # multiplicative decay
-        self.usingA = True                      # which buffer are we using
+        self.elapsed = gl_program.GLUniform()   # dt / tau
         super(FadeProgram, self).__init__()
 
     def vertex_shader(self):
@@ -31,51 +137,46 @@ class FadeProgram(gl_program.GLProgram):
             }
             """
     def fragment_shader(self):
+        if self.in_place:
+            return """#version 110
+
+            void main()
+            {
+                // the fading is all done by the blending
+                gl_FragColor = vec4(0.);
+            }
+            """
         return """#version 110
             uniform sampler2D texture1;
-            uniform float decay;
+            uniform vec4 decay;
+            uniform vec4 elapsed;
 
             void main()
             {
-                // look up the texture value, then decay it a bit
-                gl_FragColor = texture2D(texture1, gl_TexCoord[0].st) * decay;
+                // look up the texture value, then fade it
+                vec4 c = texture2D(texture1, gl_TexCoord[0].st);
+                %s
             }
-            """
+            """ % KERNELS[self.kernel].strip()
 
     def initialize(self):
-        # create the textures
-        self.textureA = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureA)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
-                           gl.GL_NEAREST)  # don't blur the texture
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
-                           gl.GL_NEAREST)  # don't blur the texture
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
-                           gl.GL_CLAMP_TO_EDGE)  # don't wrap around
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T,
-                           gl.GL_CLAMP_TO_EDGE)  # don't wrap around
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA,
-                           self.width, self.height, 0,
-                           gl.GL_RGBA, gl.GL_UNSIGNED_SHORT, None)
-
-
-        self.textureB = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureB)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
-                           gl.GL_NEAREST)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
-                           gl.GL_NEAREST)
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
-                           gl.GL_CLAMP_TO_EDGE)
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T,
-                           gl.GL_CLAMP_TO_EDGE)
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA,
-                           self.width, self.height, 0,
-                           gl.GL_RGBA, gl.GL_UNSIGNED_SHORT, None)
-
-        # create the frame buffers
-        self.fbA = gl.glGenFramebuffers(1)
-        self.fbB = gl.glGenFramebuffers(1)
+        # create the textures, only one if it is faded in place or not
+        # at all
+        self.target = render_target.PingPongTarget(
+            self.width, self.height, self.internal_format,
+            count=1 if self.single else 2)
+
+        if self.lazy:
+            # no spikes yet, so make the last spike times very long ago
+            gl.glClearColor(0, 0, 0, -1e30)
+            self.target.clear()
+            gl.glClearColor(0, 0, 0, 0)
+            return
+        self.target.clear()
+
+        if self.tiles is not None:
+            # where the squares covering the live tiles are put
+            self.tile_buffer = buffers.StreamBuffer()
 
         # create a convenient square for rendering
         # data is in (x, y, z, u, v) format
@@ -93,41 +194,105 @@ class FadeProgram(gl_program.GLProgram):
     def swap_frame_buffer(self, swap=True):
         """Switch buffers so we alternate which one we're rendering to."""
         if swap:
-            self.usingA = not self.usingA
+            self.target.swap()
 
-        if self.usingA:
-            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbA);
-            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER,
-                  gl.GL_COLOR_ATTACHMENT0,
-                  gl.GL_TEXTURE_2D, self.textureA, 0);
+        # render to the whole of the current texture
+        self.target.bind()
+
+
+    def timestamp(self, now=None):
+        """The current time, for stamping spikes in lazy mode.
+
+        This is the given time (e.g. the simulation time) or else the
+        monotonic clock relative to when we were created, so it stays
+        small enough to keep its precision as a 32-bit float.
+        """
+        if now is None:
+            now = clock() - self.start_time
+        return now
+
+    def note_spikes(self, peak=1.0, now=None):
+        """Tell the fader that spikes have just been drawn.
+
+        peak is the brightest any texel could now be.  This is what
+        is_quiescent goes by.
+        """
+        quiet_time = self.timestamp(now) + self.lifetime(peak)
+        if self.quiet_time is None or quiet_time > self.quiet_time:
+            self.quiet_time = quiet_time
+
+    def is_quiescent(self, now=None):
+        """Whether everything has faded below the threshold.
+
+        This is worked out from the time of the last spikes noted with
+        note_spikes, so it needs tau.  Once it is True, nothing will
+        change until more spikes arrive, so there is no need to keep
+        painting.
+        """
+        return (self.quiet_time is None or
+                self.timestamp(now) >= self.quiet_time)
+
+    def elapsed_decay(self, now=None):
+        """The decay for the time since the last frame, using tau.
+
+        now defaults to a monotonic wall clock; pass the simulation time
+        instead to fade in simulated time.
+        """
+        now = self.timestamp(now)
+        if self.last_time is None or now < self.last_time:
+            # first frame, or the clock has been switched or reset
+            self.dt = None
+            decay = 1.0
         else:
-            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbB);
-            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER,
-                  gl.GL_COLOR_ATTACHMENT0,
-                  gl.GL_TEXTURE_2D, self.textureB, 0);
+            self.dt = now - self.last_time
+            decay = np.exp(-self.dt / self.tau)
+        self.last_time = now
+        return decay
 
-        # reset the geometry so we render to the whole image
-        gl.glViewport(0, 0, self.width, self.height)
+    def paint_faded(self, decay=None, now=None):
+        """Draw a faded version of the old texture onto the new texture.
 
+        If decay isn't given it comes from tau and the time since the
+        last frame (see elapsed_decay).  Returns the decay used.
+        """
+        if decay is None:
+            if self.tau is None:
+                raise ValueError('paint_faded needs decay= or a tau')
+            decay = self.elapsed_decay(now)
+        if self.lazy:
+            # nothing to do, the fading is worked out when drawing
+            return decay
 
-    def paint_faded(self, decay):
-        """Draw a faded version of the old texture onto the new texture."""
+        if self.tiles is not None:
+            lifetime = self.lifetime()
+            self.live_tiles, died = self.tiles.update(self.timestamp(now),
+                                                      lifetime)
+            if len(died) > 0:
+                # clear them in every texture, so nothing old is left
+                # behind when they come back to life
+                self.target.clear(self.tiles.rects(died))
+            if len(self.live_tiles) == 0:
+                return decay
 
         # activate the program and set parameters
         gl.glUseProgram(self.program)
         gl.glUniform1i(self.texture1, 0)  # indicate we use GL_TEXTURE0
-        gl.glUniform1f(self.decay, decay)
+        decays = np.resize(decay, 4)    # one for each channel
+        elapsed = -np.log(np.maximum(decays, 1e-30))
+        gl.glUniform4f(self.decay, *decays)
+        gl.glUniform4f(self.elapsed, *elapsed)
 
-        # set up the texture to map
-        gl.glEnable(gl.GL_TEXTURE_2D)
-        gl.glActiveTexture(gl.GL_TEXTURE0)
-        if self.usingA:
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureB)
+        if self.in_place:
+            # multiply what is already there by the decay
+            gl.glEnable(gl.GL_BLEND)
+            gl.glBlendEquation(gl.GL_FUNC_ADD)
+            gl.glBlendColor(*decays)
+            gl.glBlendFunc(gl.GL_ZERO, gl.GL_CONSTANT_COLOR)
         else:
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureA)
-
-        # a simple square filling the whole view
-        self.square.bind()
+            # set up the texture to map
+            gl.glEnable(gl.GL_TEXTURE_2D)
+            gl.glActiveTexture(gl.GL_TEXTURE0)
+            gl.glBindTexture(gl.GL_TEXTURE_2D, self.target.previous)
 
         # activate using VBOs for the vertices
         gl.glEnableVertexAttribArray(0)
@@ -136,18 +301,68 @@ class FadeProgram(gl_program.GLProgram):
         gl.glEnableClientState(gl.GL_VERTEX_ARRAY);
         gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY);
 
-        # indicate where the vertex and texture data is
-        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT,
-                                 gl.GL_FALSE, 5*4, None)
-        gl.glTexCoordPointer(2, gl.GL_FLOAT, 5*4, self.square + 3*4)
+        if self.tiles is None:
+            # a simple square filling the whole view
+            self.square.bind()
+
+            # indicate where the vertex and texture data is
+            gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT,
+                                     gl.GL_FALSE, 5*4, None)
+            gl.glTexCoordPointer(2, gl.GL_FLOAT, 5*4, self.square + 3*4)
+
+            # draw the square
+            gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
+        else:
+            # a square for each live tile
+            vertices = self.tiles.quads(self.live_tiles)
+            offset = self.tile_buffer.write(vertices)
+            gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 5*4,
+                                     self.tile_buffer.pointer(offset))
+            gl.glTexCoordPointer(2, gl.GL_FLOAT, 5*4,
+                                 self.tile_buffer.pointer(offset + 3*4))
+            gl.glDrawArrays(gl.GL_TRIANGLES, 0, len(vertices))
+
+        if self.in_place:
+            gl.glDisable(gl.GL_BLEND)
+        return decay
 
-        # draw the square
-        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
+    def lifetime(self, peak=1.0):
+        """How long after its last spike a texel is worth fading.
+
+        peak is how bright the texel was just after the spike.
+        """
+        tau = np.max(self.tau)
+        if self.kernel == 'hold':
+            return tau
+        elif self.kernel == 'linear':
+            return tau * peak
+        lifetime = tau * max(np.log(peak / self.threshold), 0.)
+        if self.kernel == 'alpha':
+            # safely past where (t / tau) exp(1 - t / tau) drops below
+            # the threshold
+            lifetime *= 2
+        return lifetime
+
+    def display_mix(self):
+        """The colour matrix to draw the texture with (see KERNELS).
+
+        This is for DrawTextureProgram.paint, and is None if the texture
+        can be drawn as it is.
+        """
+        if self.kernel == 'alpha':
+            # show x = R - G, scaled so a single spike peaks at 1
+            mix = np.diag([0., 0., 0., 1.])
+            mix[:3, 0] = np.e
+            mix[:3, 1] = -np.e
+            return mix
+        elif self.kernel == 'hold':
+            # the green channel is just bookkeeping
+            mix = np.diag([0., 0., 0., 1.])
+            mix[:3, 0] = 1.
+            return mix
+        return None
 
     def get_current_texture(self):
         """Helper function to get a handle to the active texture."""
-        if self.usingA:
-            return self.textureA
-        else:
-            return self.textureB
+        return self.target.current
 
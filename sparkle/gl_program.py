@@ -2,6 +2,57 @@ import inspect
 
 import numpy as np
 import OpenGL.GL as gl
+import OpenGL.contextdata
+
+
+# linked programs, by GL context and shader source (see cache_programs)
+program_cache = {}
+
+
+# internal formats that only have a red channel
+SINGLE_CHANNEL_FORMATS = (gl.GL_R8, gl.GL_R16F, gl.GL_R32F)
+
+
+def create_texture(width, height, internal_format=gl.GL_RGBA):
+    """Make an empty texture to render into.
+
+    Single-channel textures (see SINGLE_CHANNEL_FORMATS) are swizzled so
+    that they read as grey, and can be drawn like any other texture.
+    """
+    texture = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
+                       gl.GL_NEAREST)  # don't blur the texture
+    gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
+                       gl.GL_NEAREST)  # don't blur the texture
+    gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
+                       gl.GL_CLAMP_TO_EDGE)  # don't wrap around
+    gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T,
+                       gl.GL_CLAMP_TO_EDGE)  # don't wrap around
+
+    if internal_format in SINGLE_CHANNEL_FORMATS:
+        pixel_format = gl.GL_RED
+        gl.glTexParameteriv(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_SWIZZLE_RGBA,
+                            [gl.GL_RED, gl.GL_RED, gl.GL_RED, gl.GL_ONE])
+    else:
+        pixel_format = gl.GL_RGBA
+    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, internal_format,
+                    width, height, 0,
+                    pixel_format, gl.GL_UNSIGNED_SHORT, None)
+    return texture
+
+
+def channel_taus(tau):
+    """One time constant for each RGBA channel.
+
+    tau is a single time constant or a list of up to four, padded out
+    with the last one.
+    """
+    tau = np.atleast_1d(np.asarray(tau, dtype=float))
+    if not 1 <= len(tau) <= 4:
+        raise ValueError('Give up to four time constants, one for each '
+                         'channel')
+    return np.append(tau, [tau[-1]] * (4 - len(tau)))
 
 
 class GLUniform(object):
@@ -13,17 +64,50 @@ class GLUniform(object):
 
 class GLProgram(object):
 
+    # set this to share one linked program between all the instances
+    # (in the same GL context) that have the same shader source, which is
+    # worthwhile when the source is generated from a few variants
+    cache_programs = False
+
     # list of known types of shaders
     SHADER_TYPES = dict(vertex_shader=gl.GL_VERTEX_SHADER,
-                        fragment_shader=gl.GL_FRAGMENT_SHADER)
+                        fragment_shader=gl.GL_FRAGMENT_SHADER,
+                        compute_shader=gl.GL_COMPUTE_SHADER)
+
+    # override these to return the source of each shader you need
+    def vertex_shader(self):
+        return None
+
+    def fragment_shader(self):
+        return None
+
+    def compute_shader(self):
+        return None
 
     def link(self):
         """Initialize the program for use."""
+        sources = dict((name, getattr(self, name)())
+                       for name in self.SHADER_TYPES)
+        if self.cache_programs:
+            key = (OpenGL.contextdata.getContext(),
+                   tuple(sorted(sources.items())))
+            if key not in program_cache:
+                program_cache[key] = self.link_program(sources)
+            self.program = program_cache[key]
+        else:
+            self.program = self.link_program(sources)
+
+        # initialize everything else as needed
+        self.initialize_uniforms()
+        self.initialize()
+
+    def link_program(self, sources):
+        """Compile and link the given shader sources, by shader type."""
         program = gl.glCreateProgram()
 
         # compile all the shaders
         for name, code in self.SHADER_TYPES.items():
-            source = getattr(self, name)()
+            source = sources[name]
             if source is not None:
                 shader = gl.glCreateShader(code)
                 gl.glShaderSource(shader, source)
@@ -37,12 +121,7 @@ class GLProgram(object):
         success = gl.glGetProgramiv(program, gl.GL_LINK_STATUS)
         if success != gl.GL_TRUE:
             raise RuntimeError(gl.glGetProgramInfoLog(program))
-
-        self.program = program
-
-        # initialize everything else as needed
-        self.initialize_uniforms()
-        self.initialize()
+        return program
 
     def initialize_uniforms(self):
         """Register the identified variables so we can pass data in later."""
@@ -0,0 +1,282 @@
+import ctypes
+import mmap
+import zlib
+
+import numpy as np
+import OpenGL.GL as gl
+
+import gl_program
+
+
+# the formats we read back as floats rather than bytes
+FLOAT_FORMATS = (gl.GL_R16F, gl.GL_R32F, gl.GL_RGBA16F, gl.GL_RGBA32F)
+
+# the index file starts with this, then the width, height, internal
+# format and tile width, and then has a (tile, offset, nbytes) entry for
+# each tile, all as int64
+INDEX_MAGIC = 0x53504b4c48495354
+
+
+class HistoryArchive(object):
+    """Keep the columns that scroll off a ring raster in a file.
+
+    A SlideProgram in ring mode hands over each run of columns just
+    before it clears them for reuse.  They are read back into pixel
+    buffer objects, and a fence is placed after each read so the data is
+    only picked up once the GPU has got to it, without stalling.  The
+    columns are gathered into tiles of tile_width columns, and each full
+    tile is compressed and appended to the file at path, with an entry
+    in path + '.idx' saying where it went.  HistoryArchive.open reads
+    an archive back once it has been closed, for instance in a later
+    session.
+
+    Columns are numbered from the start of the raster, the cursor column
+    being SlideProgram.head_column.  load and page_in read them back from
+    the file through mmap, so minutes of history can be scrolled back
+    through without keeping it on the GPU.  Columns that were never
+    archived (from before the start, or skipped over in one go) come
+    back as zeros.
+    """
+    def __init__(self, path, width, height, internal_format=gl.GL_RGBA,
+                 tile_width=64, buffers=4, level=6, mode='w'):
+        if mode not in ('w', 'r'):
+            raise ValueError('Unknown mode %r' % mode)
+        self.path = path
+        self.width = width          # size of the ring raster
+        self.height = height        # size of the ring raster
+        self.internal_format = internal_format
+        self.tile_width = tile_width
+        self.level = level          # zlib compression level
+        self.n_buffers = buffers    # how many reads can be in flight
+
+        if internal_format in gl_program.SINGLE_CHANNEL_FORMATS:
+            self.channels, self.format = 1, gl.GL_RED
+        else:
+            self.channels, self.format = 4, gl.GL_RGBA
+        if internal_format in FLOAT_FORMATS:
+            self.dtype, self.type = np.dtype(np.float32), gl.GL_FLOAT
+        else:
+            self.dtype, self.type = np.dtype(np.uint8), gl.GL_UNSIGNED_BYTE
+        self.column_bytes = height * self.channels * self.dtype.itemsize
+
+        # where each tile is in the file, as tile: (offset, nbytes)
+        self.index = {}
+        self.size = 0               # bytes written to the file
+        self.map = None             # the file mapped for reading
+        if mode == 'w':
+            self.file = open(path, 'wb')
+            self.index_file = open(path + '.idx', 'wb')
+            self.index_file.write(np.array(
+                [INDEX_MAGIC, width, height, internal_format, tile_width],
+                dtype=np.int64).tobytes())
+        else:
+            # read only, so nothing is written
+            self.file = self.index_file = None
+            entries = self.read_index(path)[5:].reshape(-1, 3)
+            for tile_id, offset, nbytes in entries:
+                self.index[int(tile_id)] = (int(offset), int(nbytes))
+
+        # the tile being gathered, and which one it is
+        self.tile = None
+        self.tile_id = None
+
+        self.pbos = None            # made by the first read
+        self.free = []              # pixel buffers not in use
+        self.pending = []           # reads in flight, oldest first
+        self.texture = None         # for page_in
+
+    @staticmethod
+    def read_index(path):
+        """The index file for the archive at path, as int64s."""
+        with open(path + '.idx', 'rb') as f:
+            index = np.frombuffer(f.read(), dtype=np.int64)
+        if len(index) < 5 or index[0] != INDEX_MAGIC:
+            raise ValueError('%s is not a history archive' % path)
+        return index
+
+    @classmethod
+    def open(cls, path):
+        """Open an archive that has already been written, to read it."""
+        width, height, internal_format, tile_width = cls.read_index(path)[1:5]
+        return cls(path, int(width), int(height), int(internal_format),
+                   int(tile_width), mode='r')
+
+    def tile_shape(self):
+        return (self.height, self.tile_width, self.channels)
+
+    def evict(self, frame_buffer, first, count):
+        """Start reading back count columns, the oldest being first.
+
+        frame_buffer holds the ring texture, where column c is at
+        x = c % width.  Must be called before the columns are cleared.
+        """
+        if count <= 0:
+            return
+        if self.file is None:
+            raise ValueError('The archive was opened read only')
+        if self.pbos is None:
+            self.pbos = list(gl.glGenBuffers(self.n_buffers))
+            for pbo in self.pbos:
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+                gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER,
+                                self.width * self.column_bytes, None,
+                                gl.GL_STREAM_READ)
+            self.free = list(self.pbos)
+
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, frame_buffer)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        while count > 0:
+            # read up to the right hand edge, then wrap round
+            x = first % self.width
+            n = min(count, self.width - x)
+            if not self.free:
+                self.finish(self.pending[0])
+            pbo = self.free.pop()
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+            gl.glReadPixels(x, 0, n, self.height, self.format, self.type,
+                            ctypes.c_void_p(0))
+            fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.pending.append((pbo, fence, first, n))
+            first += n
+            count -= n
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, 0)
+
+        self.poll()
+
+    def poll(self):
+        """Pick up the reads the GPU has finished, without waiting."""
+        while self.pending:
+            status = gl.glClientWaitSync(self.pending[0][1], 0, 0)
+            if status not in (gl.GL_ALREADY_SIGNALED,
+                              gl.GL_CONDITION_SATISFIED):
+                break
+            self.finish(self.pending[0])
+
+    def finish(self, read):
+        """Wait for a read to finish and add its columns to the tiles."""
+        pbo, fence, first, n = read
+        while gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT,
+                                  1000000) == gl.GL_TIMEOUT_EXPIRED:
+            pass
+        gl.glDeleteSync(fence)
+        self.pending.remove(read)
+
+        nbytes = n * self.column_bytes
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+        address = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, nbytes,
+                                      gl.GL_MAP_READ_BIT)
+        address = ctypes.cast(address, ctypes.c_void_p).value
+        data = np.frombuffer((ctypes.c_ubyte * nbytes).from_address(address),
+                             dtype=self.dtype).copy()
+        gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.free.append(pbo)
+
+        data = data.reshape(self.height, n, self.channels)
+        for i in range(n):
+            self.add_column(first + i, data[:, i])
+
+    def add_column(self, column, data):
+        tile_id = column // self.tile_width
+        if tile_id != self.tile_id:
+            self.write_tile()
+            self.tile = np.zeros(self.tile_shape(), dtype=self.dtype)
+            self.tile_id = tile_id
+        self.tile[:, column % self.tile_width] = data
+        if column % self.tile_width == self.tile_width - 1:
+            self.write_tile()
+
+    def write_tile(self):
+        """Compress the tile being gathered onto the end of the file."""
+        if self.tile is None:
+            return
+        compressed = zlib.compress(self.tile.tobytes(), self.level)
+        self.file.write(compressed)
+        self.index[self.tile_id] = (self.size, len(compressed))
+        self.index_file.write(np.array(
+            [self.tile_id, self.size, len(compressed)], dtype=np.int64)
+            .tobytes())
+        self.size += len(compressed)
+        self.tile = None
+        self.tile_id = None
+
+    def flush(self):
+        """Wait for every read and write out everything gathered so far.
+
+        The last tile is written even if it isn't full, so don't keep
+        evicting afterwards.
+        """
+        if self.file is None:
+            return
+        while self.pending:
+            self.finish(self.pending[0])
+        self.write_tile()
+        self.file.flush()
+        self.index_file.flush()
+
+    def close(self):
+        """Write out everything gathered so far and close the files.
+
+        Needs the GL context to still be current, to finish the reads.
+        """
+        self.flush()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+            self.file = self.index_file = None
+
+    def read_tile(self, tile_id):
+        """The given tile as a (height, tile_width, channels) array."""
+        if tile_id == self.tile_id:
+            return self.tile
+        if tile_id not in self.index:
+            return None
+        offset, nbytes = self.index[tile_id]
+        if self.map is None or offset + nbytes > len(self.map):
+            # the file has grown since we mapped it
+            if self.file is not None:
+                self.file.flush()
+            if self.map is not None:
+                self.map.close()
+            with open(self.path, 'rb') as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data = zlib.decompress(self.map[offset:offset + nbytes])
+        return np.frombuffer(data, dtype=self.dtype).reshape(
+            self.tile_shape())
+
+    def load(self, first, count):
+        """Columns first to first + count as a (height, count, channels)
+        array."""
+        data = np.zeros((self.height, count, self.channels),
+                        dtype=self.dtype)
+        column = first
+        while column < first + count:
+            tile_id = column // self.tile_width
+            start = column - tile_id * self.tile_width
+            n = min(self.tile_width - start, first + count - column)
+            tile = self.read_tile(tile_id)
+            if tile is not None:
+                data[:, column - first:column - first + n] = \
+                    tile[:, start:start + n]
+            column += n
+        return data
+
+    def page_in(self, first):
+        """Load a raster's width of columns from first into a texture.
+
+        Returns the texture, which is reused by each call and can be
+        drawn with DrawTextureProgram.paint.
+        """
+        if self.texture is None:
+            self.texture = gl_program.create_texture(
+                self.width, self.height, self.internal_format)
+        data = self.load(first, self.width)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0, self.width,
+                           self.height, self.format, self.type, data)
+        return self.texture
@@ -8,6 +8,7 @@ import numpy as np
 
 import spiker
 import fader
+import tiles
 import draw_texture
 import qt_helpers
 
@@ -15,6 +16,14 @@ sparkle_width = 64
 sparkle_height = 64
 spikes_per_frame = 1
 decay_time = 0.01
+# set to a rate (Hz) to generate the spikes on the GPU instead
+synthetic_rate = None
+# fade the one texture in place rather than copying between two
+in_place_fade = False
+# set to a tile size to only fade the parts of the plot that have spikes
+tile_size = None
+# how spikes fade: 'exponential', 'linear', 'alpha' or 'hold'
+decay_kernel = 'exponential'
 
 
 class GLPlotWidget(QGLWidget):
@@ -27,53 +36,57 @@ class GLPlotWidget(QGLWidget):
 
 
     def initializeGL(self):
+        # which parts of the plot need fading
+        tracker = None
+        if tile_size is not None:
+            tracker = tiles.TileTracker(sparkle_width, sparkle_height,
+                                        tile_size)
+
         # program for drawing spikes
-        self.spiker = spiker.SpikeProgram(sparkle_width, sparkle_height)
+        self.spiker = spiker.SpikeProgram(sparkle_width, sparkle_height,
+                                          tiles=tracker)
         self.spiker.link()
+        if synthetic_rate is not None:
+            self.spiker.set_rate_map(synthetic_rate)
 
         # program for fading sparkleplot
-        self.fader = fader.FadeProgram(sparkle_width, sparkle_height)
+        self.fader = fader.FadeProgram(sparkle_width, sparkle_height,
+                                       tau=decay_time,
+                                       in_place=in_place_fade, tiles=tracker,
+                                       kernel=decay_kernel)
         self.fader.link()
 
         # program for rendering a texture on the screen
         self.draw_texture = draw_texture.DrawTextureProgram()
         self.draw_texture.link()
 
-        self.last_time = None
-
     def paintGL(self):
-        now = time.clock()
-        if self.last_time is None:
-            decay = 0.0
-            self.dt = None
-        else:
-            dt = now - self.last_time
-            if self.dt is None:
-                self.dt = dt
-            else:
-                self.dt = (0.9) * self.dt + (0.1) * dt
-            decay = np.exp(-self.dt / decay_time)
-        self.last_time = now
-
-        # fade out the sparkle plot
+        # fade out the sparkle plot by however long the last frame took
         self.fader.swap_frame_buffer()
-        self.fader.paint_faded(decay=decay)
+        decay = self.fader.paint_faded()
 
-        #data = self.data
-        data = np.random.randint(sparkle_width * sparkle_height,
-                                 size=spikes_per_frame)
+        if synthetic_rate is not None:
+            # generate and paint the spikes on the GPU
+            if self.fader.dt is not None:
+                self.spike_count += self.spiker.paint_synthetic(
+                    self.fader.dt, scale = 1.0 - decay)
+        else:
+            #data = self.data
+            data = np.random.randint(sparkle_width * sparkle_height,
+                                     size=spikes_per_frame)
 
-        # generate spike data
-        self.spike_count += len(data)
-        # paint the spikes onto the sparkle plot
-        self.spiker.paint_spikes(data, scale = 1.0 - decay)
+            # generate spike data
+            self.spike_count += len(data)
+            # paint the spikes onto the sparkle plot
+            self.spiker.paint_spikes(data, scale = 1.0 - decay)
 
         # switch to rendering on the screen
         gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
         gl.glViewport(0, 0, self.width, self.height)
 
         # draw the sparkle plot on the screen
-        self.draw_texture.paint(self.fader.get_current_texture())
+        self.draw_texture.paint(self.fader.get_current_texture(),
+                                mix=self.fader.display_mix())
 
         # print out spike rate
         now = time.time()
@@ -33,7 +33,8 @@ app = QTApp()
 
 
 class SparklePlot(object):
-    def __init__(self, ens, width=None, height=None, decay_time=0.1):
+    def __init__(self, ens, width=None, height=None, decay_time=0.1,
+                 lazy=False):
         self.ens = ens
         if width is None:
             width = int(np.sqrt(ens.n_neurons))
@@ -44,6 +45,7 @@ class SparklePlot(object):
                 height += 1
         self.height = height
         self.decay_time = decay_time
+        self.lazy = lazy    # fade when drawing rather than every frame
         self.win = None
 
         self.node = nengo.Node(self.gather_data, size_in=ens.n_neurons)
@@ -51,21 +53,23 @@ class SparklePlot(object):
 
     def gather_data(self, t, x):
         if self.win is not None:
-            spikes = np.nonzero(x)[0]
-            self.win.widget.add_spikes(spikes)
+            # x is reused by the simulator, so hand over a copy and leave
+            # it to the renderer to decide how to draw it
+            self.win.widget.add_spikes(t, x != 0)
 
     def show(self):
         self.win = SparklePlotWindow(self.width, self.height,
-                                             self.decay_time)
+                                     self.decay_time, self.lazy)
         app.add(self.win)
 
 
 class SparklePlotWindow(QtGui.QMainWindow):
-    def __init__(self, sparkle_width, sparkle_height, decay_time):
+    def __init__(self, sparkle_width, sparkle_height, decay_time,
+                 lazy=False):
         super(SparklePlotWindow, self).__init__()
         # initialize the GL widget
         self.widget = GLSparklePlotWidget(sparkle_width, sparkle_height,
-                                          decay_time)
+                                          decay_time, lazy)
         # put the window at the screen position (100, 100)
         self.setGeometry(100, 100, self.widget.width, self.widget.height)
         self.setCentralWidget(self.widget)
@@ -77,14 +81,23 @@ class GLSparklePlotWidget(QGLWidget):
     width, height = 600, 600
     t_last_msg = time.time()
     spike_count = 0
+    # emitted by the simulator thread to wake up an idle plot
+    spikes_arrived = QtCore.pyqtSignal()
+    # how long (wall clock) without a new time step means it has paused
+    pause_time = 0.05
 
-    def __init__(self, sparkle_width, sparkle_height, decay_time):
+    def __init__(self, sparkle_width, sparkle_height, decay_time,
+                 lazy=False):
         self.sparkle_width = sparkle_width
         self.sparkle_height = sparkle_height
         self.decay_time = decay_time
+        self.lazy = lazy
         self.data = []
-        self.last_time = None
+        self.sim_time = None    # latest simulation time we've heard about
+        self.sim_wall_time = None   # and when (wall clock) we heard it
+        self.idle = False       # stopped painting until more spikes come
         super(GLSparklePlotWidget, self).__init__()
+        self.spikes_arrived.connect(self.update)
 
     def initializeGL(self):
         # program for drawing spikes
@@ -93,47 +106,74 @@ class GLSparklePlotWidget(QGLWidget):
         self.spiker.link()
 
         # program for fading sparkleplot
-        self.fader = fader.FadeProgram(self.sparkle_width, self.sparkle_height)
+        self.fader = fader.FadeProgram(self.sparkle_width, self.sparkle_height,
+                                       tau=self.decay_time, lazy=self.lazy)
         self.fader.link()
 
         # program for rendering a texture on the screen
-        self.draw_texture = draw_texture.DrawTextureProgram()
+        self.draw_texture = draw_texture.DrawTextureProgram(lazy=self.lazy)
         self.draw_texture.link()
 
-    def add_spikes(self, spikes):
+    def add_spikes(self, t, spikes):
         #self.fader.swap_frame_buffer(swap=False)
         #self.spiker.paint_spikes(spikes.astype('int32'))
-        self.data.append(np.copy(spikes).astype('int32'))
+        self.data.append((t, spikes))
+        self.sim_wall_time = time.time()    # set first, for paintGL
+        self.sim_time = t
         if len(self.data) > 5:
             self.data = self.data[-5:]
+        # wake up for new spikes, or if the simulator has come back from
+        # a pause with the plot still lit
+        if self.idle and (spikes.any() or not self.fader.is_quiescent(t)):
+            self.idle = False
+            self.spikes_arrived.emit()
 
     def paintGL(self):
-        now = time.time()
-        if self.last_time is None:
-            decay = 1.0
+        # fade out the sparkle plot by however much simulated time has
+        # passed (or wall clock time, until the simulation starts), unless
+        # it has all faded away already
+        if self.fader.is_quiescent(self.sim_time):
+            self.fader.swap_frame_buffer(swap=False)
         else:
-            decay = np.exp((self.last_time - now) / self.decay_time)
-        decay = 0.9
-        self.last_time = now
+            self.fader.swap_frame_buffer()
+            self.fader.paint_faded(now=self.sim_time)
 
-        # fade out the sparkle plot
-        self.fader.swap_frame_buffer()
-        self.fader.paint_faded(decay=decay)
+        # in lazy mode the spikes are stamped with the time instead
+        stamp = None
+        if self.lazy:
+            stamp = self.fader.timestamp(self.sim_time)
 
-        while len(self.data) > 0:
-            data = self.data.pop()
-            self.spike_count += len(data)
+        data, self.data = self.data, []
+        count = 0
+        if len(data) == 1:
             # paint the spikes onto the sparkle plot
-            self.spiker.paint_spikes(data, scale=1)
+            count = self.spiker.paint_vector(data[0][1], scale=1,
+                                             timestamp=stamp)
+        elif len(data) > 1:
+            # we've fallen behind, so draw all the steps at once, faded
+            # by how long ago they happened
+            times = [t for t, spikes in data]
+            chunks = [np.flatnonzero(spikes) for t, spikes in data]
+            count = self.spiker.paint_spikes_batch(
+                chunks, times, tau=self.decay_time, scale=1,
+                timestamp=stamp)
+        if count > 0:
+            self.spike_count += count
+            self.fader.note_spikes(now=self.sim_time)
 
         # switch to rendering on the screen
         gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
         gl.glViewport(0, 0, self.width, self.height)
 
         # draw the sparkle plot on the screen
-        self.draw_texture.paint(self.fader.get_current_texture())
+        if self.lazy:
+            self.draw_texture.paint(self.fader.get_current_texture(),
+                                    now=stamp, tau=self.decay_time)
+        else:
+            self.draw_texture.paint(self.fader.get_current_texture())
 
         # print out spike rate
+        now = time.time()
         if now > self.t_last_msg + 1:
             dt = now - self.t_last_msg
             rate = self.spike_count * 0.000001 / dt
@@ -141,6 +181,17 @@ class GLSparklePlotWidget(QGLWidget):
             self.spike_count = 0
             self.t_last_msg = now
 
+        # once everything has faded nothing changes until more spikes
+        # arrive, and while the simulator is paused nothing fades, so
+        # either way stop painting and let add_spikes wake us up
+        paused = (self.sim_time is not None and
+                  time.time() - self.sim_wall_time > self.pause_time)
+        if paused or self.fader.is_quiescent(self.sim_time):
+            self.idle = True
+            if len(self.data) == 0:
+                return
+            self.idle = False
+
         # flag a redraw
         self.update()
 
@@ -8,6 +8,8 @@ import numpy as np
 
 import raster
 import slider
+import history
+import pyramid
 import draw_texture
 import qt_helpers
 
@@ -15,6 +17,16 @@ raster_width = 1024
 raster_height = 64
 raster_n_neurons = 64
 spikes_per_frame = 5
+# scroll by moving a cursor around a ring rather than copying the raster
+ring_raster = True
+# how to combine neurons sharing a row: 'any', 'count' or 'max'
+raster_aggregate = 'count'
+# set to a file name to keep the columns that scroll off (ring mode only)
+history_path = None
+# how many columns of time to show, zooming out through a pyramid of
+# pooled rasters when it's more than raster_width
+view_columns = raster_width
+pyramid_levels = 8
 
 class GLPlotWidget(QGLWidget):
     # default window size
@@ -22,57 +34,77 @@ class GLPlotWidget(QGLWidget):
     t_last_msg = time.time()
     spike_count = 0
     last_time = None
+    history = None
 
 
     def initializeGL(self):
         # program for drawing spikes
         self.raster = raster.RasterProgram(raster_width, raster_height,
-                                           raster_n_neurons)
+                                           raster_n_neurons,
+                                           aggregate=raster_aggregate)
         self.raster.link()
 
-        # program for fading sparkleplot
-        self.slider = slider.SlideProgram(raster_width, raster_height)
+        # program for fading sparkleplot, counting in floats if need be
+        internal_format = gl.GL_RGBA
+        if raster_aggregate == 'count':
+            internal_format = gl.GL_R32F
+        self.history = None
+        if history_path is not None:
+            self.history = history.HistoryArchive(history_path, raster_width,
+                                                  raster_height,
+                                                  internal_format)
+        self.slider = slider.SlideProgram(raster_width, raster_height,
+                                          internal_format=internal_format,
+                                          ring=ring_raster,
+                                          history=self.history)
         self.slider.link()
 
+        # program for the zoomed out rasters
+        self.pyramid = pyramid.RasterPyramid(self.slider, pyramid_levels)
+        self.pyramid.link()
+
         # program for rendering a texture on the screen
         self.draw_texture = draw_texture.DrawTextureProgram()
         self.draw_texture.link()
 
 
     def paintGL(self):
+        # scroll by the time since the last frame, to the nearest column
         now = time.time()
-        if self.last_time is None:
-            decay = 0.0
-            self.dt = None
-        else:
-            dt = now - self.last_time
-            if self.dt is None:
-                self.dt = dt
-            else:
-                #self.dt = dt
-                self.dt = (0.9) * self.dt + (0.1) * dt
-        self.last_time = now
-
-        if self.dt is not None:
-            self.slider.swap_frame_buffer(int(self.dt/0.001))
-            self.slider.paint_slid()
+        self.slider.scroll_to(now)
 
         #data = self.data
         data = np.random.randint(raster_n_neurons,
                                  size=spikes_per_frame).astype('int32')
+        # spread the spikes out over the time since the last frame
+        if self.last_time is None:
+            times = now
+        else:
+            times = np.random.uniform(self.last_time, now, size=len(data))
+        self.last_time = now
 
         # generate spike data
         self.spike_count += len(data)
         # paint the spikes onto the sparkle plot
         self.slider.swap_frame_buffer(0, False)
-        self.raster.paint_spikes(data)
+        self.raster.paint_spikes(data, column=self.slider.cursor,
+                                 times=times,
+                                 head_time=self.slider.head_time,
+                                 column_dt=self.slider.column_dt,
+                                 wrap=ring_raster)
+
+        # pool the finished columns into the zoomed out rasters
+        self.pyramid.update()
 
         # switch to rendering on the screen
         gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
         gl.glViewport(0, 0, self.width, self.height)
 
-        # draw the sparkle plot on the screen
-        self.draw_texture.paint(self.slider.get_current_texture())
+        # draw the raster at the level that fits the time span shown
+        level = self.pyramid.level_for(view_columns)
+        gain = self.raster.display_gain() * self.pyramid.display_gain(level)
+        self.draw_texture.paint(self.pyramid.texture(level), gain=gain,
+                                offset=self.pyramid.texture_offset(level))
 
         # print out spike rate
         now = time.time()
@@ -86,6 +118,13 @@ class GLPlotWidget(QGLWidget):
         # flag a redraw
         self.update()
 
+    def close_history(self):
+        """Write out the last of the history, while we have a context."""
+        if self.history is not None:
+            self.makeCurrent()
+            self.history.close()
+            self.history = self.slider.history = None
+
     def resizeGL(self, width, height):
         """Called upon window resizing: reinitialize the viewport."""
         # update the window size
@@ -105,5 +144,9 @@ if __name__ == '__main__':
             self.setCentralWidget(self.widget)
             self.show()
 
+        def closeEvent(self, event):
+            self.widget.close_history()
+            super(TestWindow, self).closeEvent(event)
+
     # show the window
     win = qt_helpers.create_window(TestWindow)
@@ -0,0 +1,177 @@
+import OpenGL.GL as gl
+
+import gl_program
+import render_target
+
+
+class RasterPyramid(gl_program.GLProgram):
+    """Zoomed out copies of a raster, for showing long spans of time.
+
+    Level 0 is the SlideProgram's own texture, and each level k above it
+    is a ring texture of the same size in which each column pools two
+    columns of level k - 1, so it covers 2**k times as much time.  pool
+    is 'max' (a spike anywhere in the bin shows at full brightness) or
+    'sum' (counts, which wants a float format and a gain of
+    display_gain(k)).
+
+    Call update once the slider has scrolled each frame.  A column of
+    level k is made as soon as both the columns under it are finished,
+    which is a column-wide quad per new column, so keeping the levels up
+    to date costs next to nothing however long a span they cover.  Then
+    draw texture(k) with texture_offset(k), choosing k with level_for.
+    """
+    POOLS = {
+        'max': 'max(a, b)',
+        'sum': 'a + b',
+        }
+
+    def __init__(self, slider, levels=8, pool='max'):
+        if pool not in self.POOLS:
+            raise ValueError('Unknown pool %r' % pool)
+        self.slider = slider
+        self.width = slider.width
+        self.height = slider.height
+        self.levels = levels
+        self.pool = pool
+        self.first = gl_program.GLUniform()         # the first new column
+        self.source_first = gl_program.GLUniform()  # and what it pools
+        self.source_texture = gl_program.GLUniform()    # the level below
+        super(RasterPyramid, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 330
+            uniform int first;
+            uniform int source_first;
+            flat out int source;
+
+            const vec2 corners[6] = vec2[6](
+                vec2(0., 0.), vec2(1., 0.), vec2(1., 1.),
+                vec2(0., 0.), vec2(1., 1.), vec2(0., 1.));
+
+            void main()
+            {
+                // a column-wide quad for each new column, wrapping round
+                int x = (first + gl_InstanceID) %% %(width)d;
+                source = (source_first + 2 * gl_InstanceID) %% %(width)d;
+
+                vec2 corner = corners[gl_VertexID];
+                gl_Position = vec4((x + corner.x) * 2.0 / %(width)d - 1.0,
+                                   corner.y * 2.0 - 1.0, 0., 1.);
+            }
+            """ % dict(width=self.width)
+
+    def fragment_shader(self):
+        return """#version 330
+            uniform sampler2D source_texture;
+            flat in int source;
+            out vec4 out_color;
+
+            void main()
+            {
+                // pool the two columns under this one
+                int y = int(gl_FragCoord.y);
+                vec4 a = texelFetch(source_texture, ivec2(source, y), 0);
+                vec4 b = texelFetch(source_texture,
+                                    ivec2((source + 1) %% %(width)d, y), 0);
+                out_color = %(pool)s;
+            }
+            """ % dict(width=self.width, pool=self.POOLS[self.pool])
+
+    def initialize(self):
+        # a ring texture for each level above 0
+        self.targets = []
+        for k in range(self.levels):
+            target = render_target.PingPongTarget(
+                self.width, self.height, self.slider.internal_format,
+                count=1)
+            target.clear()
+            gl.glBindTexture(gl.GL_TEXTURE_2D, target.current)
+            gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
+                               gl.GL_REPEAT)
+            self.targets.append(target)
+
+        # how many columns of each level have been made so far
+        self.done = [self.slider.head_column >> k
+                     for k in range(self.levels + 1)]
+
+    def update(self):
+        """Pool any newly finished columns up through the levels."""
+        # the column under the cursor is still being drawn into
+        self.done[0] = self.slider.head_column
+        for k in range(1, self.levels + 1):
+            new = self.done[k - 1] // 2
+            first = self.done[k]
+            if new <= first:
+                break       # so nothing above changes either
+
+            # only the columns still in the level below can be pooled;
+            # level 0's ring also holds the cursor column, being drawn
+            oldest = self.done[k - 1] - self.width
+            if k == 1:
+                oldest += 1
+            start = max(first, (oldest + 1) // 2, new - self.width)
+            target = self.targets[k - 1]
+            if start > first:
+                self.clear_columns(target, first, start - first)
+
+            if k == 1:
+                source = self.slider.get_current_texture()
+                # where level 0 column c is in the slider's texture
+                shift = self.slider.cursor - self.slider.head_column
+            else:
+                source = self.targets[k - 2].current
+                shift = 0
+            self.paint_columns(target, source, start, new - start, shift)
+            self.done[k] = new
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+
+    def clear_columns(self, target, first, count):
+        """Blank the columns that were skipped over in one go."""
+        count = min(count, self.width)
+        start = first % self.width
+        end = start + count
+        rects = [(start, 0, min(end, self.width) - start, self.height)]
+        if end > self.width:
+            rects.append((0, 0, end - self.width, self.height))
+        target.clear(rects)
+
+    def paint_columns(self, target, source, first, count, shift):
+        """Make count columns from first by pooling the source texture."""
+        target.bind()
+
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.first, first % self.width)
+        gl.glUniform1i(self.source_first, (2 * first + shift) % self.width)
+        gl.glUniform1i(self.source_texture, 0)  # indicate we use GL_TEXTURE0
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, source)
+
+        # the quads are worked out from the vertex ids, so need no arrays
+        gl.glDisableVertexAttribArray(0)
+        gl.glDrawArraysInstanced(gl.GL_TRIANGLES, 0, 6, count)
+
+    def level_for(self, columns):
+        """The lowest level that shows the given number of level 0
+        columns across its width."""
+        k = 0
+        while (self.width << k) < columns and k < self.levels:
+            k += 1
+        return k
+
+    def texture(self, k):
+        if k == 0:
+            return self.slider.get_current_texture()
+        return self.targets[k - 1].current
+
+    def texture_offset(self, k):
+        """How far to shift texture(k) by to put the newest column on the
+        right (see SlideProgram.texture_offset)."""
+        if k == 0:
+            return self.slider.texture_offset()
+        return float(self.done[k] % self.width) / self.width
+
+    def display_gain(self, k):
+        """The gain to draw texture(k) with, so sums come out as means."""
+        if self.pool == 'sum':
+            return 1.0 / (1 << k)
+        return 1.0
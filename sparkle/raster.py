@@ -1,17 +1,46 @@
+import numpy as np
 import OpenGL.GL as gl
-import OpenGL.arrays.vbo as glvbo
 
+import buffers
 import gl_program
 
 
 class RasterProgram(gl_program.GLProgram):
-    """Render a series of ints as white dots."""
-
-    def __init__(self, width, height, n_neurons):
+    """Render a series of ints as white dots.
+
+    The dots go in one column of the raster, the rightmost by default, or
+    the SlideProgram's cursor for a ring-buffer raster.  If the spikes
+    have times, each one goes back from there by however many columns
+    earlier it happened, so they land in the right place even when
+    frames come at uneven times.
+
+    With more neurons than rows, each row holds several neurons, and
+    aggregate says how their spikes are combined:
+
+        'any'    the pixel is lit if any of them spiked
+        'count'  the pixels add up (so it is a spike count with scale=1),
+                 which wants a float target such as GL_R32F
+        'max'    the pixel keeps the largest scale painted into it
+
+    The neurons go from the bottom row up in the given order (an array of
+    neuron indexes, e.g. sorted by preferred direction), or by index if
+    there is none.
+    """
+    AGGREGATES = ('any', 'count', 'max')
+
+    def __init__(self, width, height, n_neurons, aggregate='any',
+                 order=None):
+        if aggregate not in self.AGGREGATES:
+            raise ValueError('Unknown aggregate %r' % aggregate)
         self.width = width      # size of the grid
         self.height = height    # size of the grid
         self.n_neurons = n_neurons          # number of neurons
+        self.aggregate = aggregate
+        self.order = order
         self.scale = gl_program.GLUniform()     # brightness of spike
+        self.column = gl_program.GLUniform()    # where to draw the spikes
+        self.wrap = gl_program.GLUniform()      # width of a ring, or 0
+        self.rows = gl_program.GLUniform()      # the row of each neuron
         super(RasterProgram, self).__init__()
 
     def vertex_shader(self):
@@ -19,52 +48,158 @@ class RasterProgram(gl_program.GLProgram):
 
             // receive data using the vec2 called position
             layout(location = 0) in vec2 position;
+            // how many columns before the current one the spike goes in
+            layout(location = 1) in float back;
+            uniform int column;
+            uniform int wrap;
+            uniform isamplerBuffer rows;
 
             void main()
             {
                 // compute x, y indexes
-                int x = %(width)d -1;
-                int y = int(position.x * (%(height)d) / %(n_neurons)d);
+                int x = column - int(back);
+                if (x < 0) x += wrap;
+                // too old to still be on the raster
+                if (back >= %(width)d) x = -1;
+                int y = texelFetch(rows, int(position.x)).r;
 
-                // covert to a point inside (-1, 1)
-                float xx = (x - %(width)d / 2) * 2.0 / %(width)d;
-                float yy = (y - %(height)d / 2) * 2.0 / %(height)d;
+                // covert to a point inside (-1, 1), in the middle of the
+                // column
+                float xx = (x + 0.5) * 2.0 / %(width)d - 1.0;
+                float yy = (y + 0.5) * 2.0 / %(height)d - 1.0;
 
                 // return the final location of the spike
-                gl_Position = vec4(0.999, yy, 0., 1);
+                gl_Position = vec4(xx, yy, 0., 1);
             }
-            """ % dict(width=self.width, height=self.height, 
-                       n_neurons=self.n_neurons)
+            """ % dict(width=self.width, height=self.height)
 
     def fragment_shader(self):
         return """#version 330
             out vec4 out_color;
+            uniform float scale;
 
             void main()
             {
-                // draw a white dot
-                out_color = vec4(1., 1., 1., 1.);
+                // draw a dot, blended with the others in the row
+                out_color = vec4(scale, scale, scale, 1.);
             }
             """
 
-    def paint_spikes(self, data, scale=1.0):
-        """Render the given array of neuron indexes."""
-
-        # convert the data to a VBO
-        vbo = glvbo.VBO(data)
-        vbo.bind()
+    def initialize(self):
+        # a single buffer reused for streaming the spikes every frame
+        self.buffer = buffers.StreamBuffer()
+
+        # the table of which row each neuron goes in
+        self.row_buffer = gl.glGenBuffers(1)
+        self.row_texture = gl.glGenTextures(1)
+        self.set_order(self.order)
+
+    def set_order(self, order=None):
+        """Stack the neurons up from the bottom row in the given order.
+
+        order is an array of neuron indexes, or None to go by index.
+        """
+        if order is None:
+            order = np.arange(self.n_neurons)
+        order = np.asarray(order)
+        if len(order) != self.n_neurons:
+            raise ValueError('Order has %d neurons, expected %d' %
+                             (len(order), self.n_neurons))
+        self.order = order
+
+        # where each neuron comes in the order, spread over the rows
+        rank = np.empty(self.n_neurons, dtype=np.int64)
+        rank[order] = np.arange(self.n_neurons)
+        rows = (rank * self.height // self.n_neurons).astype(np.int32)
+
+        gl.glBindBuffer(gl.GL_TEXTURE_BUFFER, self.row_buffer)
+        gl.glBufferData(gl.GL_TEXTURE_BUFFER, rows, gl.GL_STATIC_DRAW)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, self.row_texture)
+        gl.glTexBuffer(gl.GL_TEXTURE_BUFFER, gl.GL_R32I, self.row_buffer)
+
+    def display_gain(self):
+        """The gain to draw the raster with in DrawTextureProgram.
+
+        In count mode a row lit by every one of its neurons comes out at
+        full brightness.
+        """
+        if self.aggregate == 'count':
+            per_row = -(-self.n_neurons // self.height)     # rounded up
+            return 1.0 / max(per_row, 1)
+        return 1.0
+
+    def blend(self):
+        """Set up blending to combine the spikes in each row."""
+        if self.aggregate == 'any':
+            return
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE)
+        if self.aggregate == 'max':
+            gl.glBlendEquation(gl.GL_MAX)
+        else:
+            gl.glBlendEquation(gl.GL_FUNC_ADD)
+
+    def paint_spikes(self, data, scale=1.0, column=None, times=None,
+                     head_time=0.0, column_dt=1.0, wrap=False):
+        """Render the given array of neuron indexes.
+
+        column defaults to the rightmost one, and is where spikes at
+        times from head_time to head_time + column_dt go.  times can be
+        one per spike or one for them all, and spikes from before
+        head_time go that many columns further left (wrapping round to
+        the right hand side if wrap is set, for a ring-buffer raster).
+        Later ones go in the current column.
+        """
+        if column is None:
+            column = self.width - 1
+        back = 0.0
+        if times is not None:
+            # worked out here in double precision, as times can be large
+            back = np.floor((np.asarray(times, dtype=float) - head_time) /
+                            column_dt)
+            back = np.maximum(-back, 0).astype('f')
+
+        # the shader reads 32-bit ints
+        data = np.asarray(data)
+        if data.dtype.itemsize != 4:
+            data = data.astype(np.uint32)
+
+        # copy the data into the streaming buffer
+        if np.ndim(back) > 0:
+            self.buffer.reserve(data.nbytes + back.nbytes + 4)
+            back_offset = self.buffer.write(back)
+        offset = self.buffer.write(data)
 
         # tell OpenGL that the VBO contains an array of vertices
         gl.glEnableVertexAttribArray(0)
 
         # array is a list of unsigned ints
         gl.glVertexAttribPointer(0, 1, gl.GL_UNSIGNED_INT,
-                                 gl.GL_FALSE, 0, None)
+                                 gl.GL_FALSE, 0, self.buffer.pointer(offset))
+
+        # and the time of each spike, in columns
+        if np.ndim(back) > 0:
+            gl.glEnableVertexAttribArray(1)
+            gl.glVertexAttribPointer(1, 1, gl.GL_FLOAT, gl.GL_FALSE, 0,
+                                     self.buffer.pointer(back_offset))
+        else:
+            gl.glDisableVertexAttribArray(1)
+            gl.glVertexAttrib1f(1, back)
 
         # activate the program
         gl.glUseProgram(self.program)
+        gl.glUniform1i(self.column, column)
+        gl.glUniform1i(self.wrap, self.width if wrap else 0)
+        gl.glUniform1f(self.scale, scale)
+        gl.glUniform1i(self.rows, 0)    # indicate we use GL_TEXTURE0
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, self.row_texture)
 
         # draw the spikes
+        self.blend()
         gl.glDrawArrays(gl.GL_POINTS, 0, len(data))
+        gl.glDisable(gl.GL_BLEND)
+        gl.glBlendEquation(gl.GL_FUNC_ADD)
+        gl.glDisableVertexAttribArray(1)
 
 
@@ -0,0 +1,111 @@
+import OpenGL.GL as gl
+
+import gl_program
+
+
+# what glCheckFramebufferStatus can tell us, for the error message
+FRAMEBUFFER_ERRORS = {
+    gl.GL_FRAMEBUFFER_UNDEFINED: 'undefined',
+    gl.GL_FRAMEBUFFER_INCOMPLETE_ATTACHMENT: 'incomplete attachment',
+    gl.GL_FRAMEBUFFER_INCOMPLETE_MISSING_ATTACHMENT: 'missing attachment',
+    gl.GL_FRAMEBUFFER_UNSUPPORTED: 'unsupported format',
+    }
+
+
+def check_frame_buffer(frame_buffer):
+    """Raise a RuntimeError if the frame buffer can't be rendered into.
+
+    The message says what is wrong, which is usually an internal format
+    the GL implementation can't render to.  Leaves the frame buffer bound.
+    """
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, frame_buffer)
+    status = gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER)
+    if status != gl.GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError('Frame buffer is not complete (%s)' %
+                           FRAMEBUFFER_ERRORS.get(status, status))
+
+
+class PingPongTarget(object):
+    """A set of textures that are rendered into in turn.
+
+    Each texture gets its own frame buffer, attached once when the target
+    is made, so moving on to the next texture is just a matter of binding
+    a different frame buffer; re-attaching textures every frame makes
+    many drivers check the frame buffer all over again.
+
+    With the default count of 2 this is the usual double buffer for
+    effects that render the previous frame into the current one (fading,
+    sliding).  A count of 1 gives a single target that is never swapped.
+    Needs a current GL context, so make it in GLProgram.initialize.
+    """
+    def __init__(self, width, height, internal_format=gl.GL_RGBA, count=2):
+        self.width = width
+        self.height = height
+        self.internal_format = internal_format
+        self.index = 0      # which texture we are rendering into
+
+        self.textures = [gl_program.create_texture(width, height,
+                                                   internal_format)
+                         for i in range(count)]
+        self.frame_buffers = []
+        for texture in self.textures:
+            frame_buffer = gl.glGenFramebuffers(1)
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, frame_buffer)
+            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER,
+                                      gl.GL_COLOR_ATTACHMENT0,
+                                      gl.GL_TEXTURE_2D, texture, 0)
+            self.frame_buffers.append(frame_buffer)
+        self.check_complete()
+
+    @property
+    def count(self):
+        return len(self.textures)
+
+    @property
+    def current(self):
+        """The texture we are rendering into."""
+        return self.textures[self.index]
+
+    @property
+    def previous(self):
+        """The texture we rendered into before the last swap."""
+        return self.textures[self.index - 1]
+
+    def check_complete(self):
+        """Make sure every frame buffer can be rendered into.
+
+        Raises a RuntimeError saying what is wrong if not (see
+        check_frame_buffer).
+        """
+        for frame_buffer in self.frame_buffers:
+            check_frame_buffer(frame_buffer)
+
+    def swap(self):
+        """Move on to rendering into the next texture."""
+        self.index = (self.index + 1) % self.count
+
+    def bind(self, x=0, y=0):
+        """Render into the current texture, offset by (x, y) pixels."""
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER,
+                             self.frame_buffers[self.index])
+        gl.glViewport(x, y, self.width, self.height)
+
+    def clear(self, rects=None):
+        """Clear all the textures, leaving the current one bound.
+
+        If a list of (x, y, width, height) rectangles is given, only
+        those parts are cleared.
+        """
+        if rects is not None:
+            gl.glEnable(gl.GL_SCISSOR_TEST)
+        for i in range(self.count):
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.frame_buffers[i])
+            if rects is None:
+                gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+            else:
+                for x, y, w, h in rects:
+                    gl.glScissor(x, y, w, h)
+                    gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        if rects is not None:
+            gl.glDisable(gl.GL_SCISSOR_TEST)
+        self.bind()
@@ -0,0 +1,175 @@
+import numpy as np
+import OpenGL.GL as gl
+import OpenGL.arrays.vbo as glvbo
+
+import gl_program
+
+
+class ScatterProgram(gl_program.GLProgram):
+    """Set spike texels with a compute shader instead of drawing points.
+
+    One invocation per spike reads the neuron index from the spike
+    buffer, looks up its position in the layout table and bumps the
+    texel in an R32UI count image, either with imageAtomicAdd (so
+    coincident spikes are counted) or with imageStore (binary).  A
+    ResolveProgram pass then adds the counts onto the render target and
+    clears the image again.
+
+    Needs GL 4.3 (compute shaders).
+    """
+
+    # number of spikes handled by each work group
+    GROUP_SIZE = 256
+
+    def __init__(self, width, height, binary=False):
+        self.width = width      # size of the grid
+        self.height = height    # size of the grid
+        self.binary = binary    # just mark spiking texels, don't count
+        self.positions = gl_program.GLUniform()  # the neuron layout table
+        self.first = gl_program.GLUniform()      # first spike in the buffer
+        self.count = gl_program.GLUniform()      # number of spikes
+        self.offset = gl_program.GLUniform()     # added to every index
+        super(ScatterProgram, self).__init__()
+
+    def compute_shader(self):
+        if self.binary:
+            write = 'imageStore(counts, pixel, uvec4(1u));'
+        else:
+            write = 'imageAtomicAdd(counts, pixel, 1u);'
+        return """#version 430
+            layout(local_size_x = %(group_size)d) in;
+
+            layout(std430, binding = 0) readonly buffer Spikes {
+                uint spikes[];
+            };
+            layout(r32ui, binding = 0) uniform uimage2D counts;
+            uniform samplerBuffer positions;
+            uniform int first;
+            uniform int count;
+            uniform int offset;
+
+            void main()
+            {
+                int k = int(gl_GlobalInvocationID.x);
+                if (k >= count) return;
+
+                // find the texel for this neuron
+                int i = int(spikes[first + k]) + offset;
+                vec2 p = texelFetch(positions, i).xy;
+                ivec2 pixel = ivec2((p * 0.5 + 0.5) *
+                                    vec2(%(width)d, %(height)d));
+
+                %(write)s
+            }
+            """ % dict(group_size=self.GROUP_SIZE, width=self.width,
+                       height=self.height, write=write)
+
+    def initialize(self):
+        # the image the spikes are counted in, starting at zero
+        self.counts = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.counts)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
+                           gl.GL_NEAREST)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_R32UI,
+                        self.width, self.height, 0,
+                        gl.GL_RED_INTEGER, gl.GL_UNSIGNED_INT,
+                        np.zeros((self.height, self.width), dtype=np.uint32))
+
+        # the pass that moves the counts onto the render target
+        self.resolve = ResolveProgram()
+        self.resolve.link()
+
+    def paint_spikes(self, buffer, positions, data, scale=1.0, offset=0):
+        """Render the given uint32 neuron indexes."""
+
+        # the indexes are read from the stream buffer as a storage buffer
+        data = data.astype(np.uint32, copy=False)
+        first = buffer.write(data) // 4
+        gl.glBindBufferBase(gl.GL_SHADER_STORAGE_BUFFER, 0, buffer.buffer)
+
+        # the positions come from the layout table
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, positions)
+        gl.glBindImageTexture(0, self.counts, 0, gl.GL_FALSE, 0,
+                              gl.GL_READ_WRITE, gl.GL_R32UI)
+
+        # scatter the spikes into the count image
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.positions, 0)   # indicate we use GL_TEXTURE0
+        gl.glUniform1i(self.first, first)
+        gl.glUniform1i(self.count, len(data))
+        gl.glUniform1i(self.offset, offset)
+        groups = (len(data) + self.GROUP_SIZE - 1) // self.GROUP_SIZE
+        gl.glDispatchCompute(groups, 1, 1)
+
+        # make the counts visible to the resolve pass
+        gl.glMemoryBarrier(gl.GL_SHADER_IMAGE_ACCESS_BARRIER_BIT)
+        self.resolve.paint_resolve(self.counts, scale=scale)
+        gl.glMemoryBarrier(gl.GL_SHADER_IMAGE_ACCESS_BARRIER_BIT)
+
+
+class ResolveProgram(gl_program.GLProgram):
+    """Add an R32UI count image onto the render target and clear it."""
+
+    def __init__(self):
+        self.scale = gl_program.GLUniform()     # brightness of spike
+        super(ResolveProgram, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 430
+
+            layout(location = 0) in vec2 position;
+
+            void main()
+            {
+                // just cover the whole grid
+                gl_Position = vec4(position, 0., 1.);
+            }
+            """
+
+    def fragment_shader(self):
+        return """#version 430
+            layout(r32ui, binding = 0) uniform uimage2D counts;
+            out vec4 out_color;
+            uniform float scale;
+
+            void main()
+            {
+                // take the count, leaving zero behind for next time
+                uint c = imageAtomicExchange(counts, ivec2(gl_FragCoord.xy),
+                                             0u);
+                if (c == 0u) discard;
+
+                out_color = vec4(vec3(float(c)), scale);
+            }
+            """
+
+    def initialize(self):
+        # a square covering the whole grid
+        self.square = glvbo.VBO(
+            np.array( [
+                [ -1,-1 ],
+                [  1,-1 ],
+                [  1, 1 ],
+                [ -1,-1 ],
+                [  1, 1 ],
+                [ -1, 1 ],
+            ],'f')
+        )
+
+    def paint_resolve(self, counts, scale=1.0):
+        gl.glBindImageTexture(0, counts, 0, gl.GL_FALSE, 0,
+                              gl.GL_READ_WRITE, gl.GL_R32UI)
+
+        gl.glUseProgram(self.program)
+        gl.glUniform1f(self.scale, scale)
+
+        self.square.bind()
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
+
@@ -3,18 +3,45 @@ import OpenGL.GL as gl
 import OpenGL.arrays.vbo as glvbo
 
 import gl_program
+import render_target
 
 
 class SlideProgram(gl_program.GLProgram):
     """Double-buffered slider algorithm.
 
     Contains two textures, and renders one onto the other, but shifted.
+    The internal_format can be a single-channel one (GL_R8, GL_R16F or
+    GL_R32F) to save memory, as with FadeProgram.
+
+    In ring mode nothing is copied at all.  There is one texture, used as
+    a ring of columns: the cursor marks the column the newest spikes go
+    in, sliding moves the cursor on and clears the columns it passes
+    over, and the texture is drawn wrapped around by texture_offset() so
+    that the cursor ends up on the right.  Scrolling then costs the same
+    however wide the raster is.
+
+    Given a column_dt, scroll_to slides by however many whole columns of
+    time have gone by, keeping the time the cursor column starts at in
+    head_time so that any fraction of a column left over is carried on
+    to the next frame rather than lost.
+
+    A HistoryArchive can be given in ring mode, to keep the columns that
+    are cleared for reuse rather than losing them.
     """
-    def __init__(self, width, height):
+    def __init__(self, width, height, internal_format=gl.GL_RGBA,
+                 ring=False, column_dt=0.001, history=None):
+        if history is not None and not ring:
+            raise ValueError('A history archive needs a ring raster')
         self.width = width
         self.height = height
+        self.internal_format = internal_format
+        self.ring = ring
+        self.history = history
+        self.cursor = width - 1     # the column for the newest spikes
+        self.head_column = width - 1    # the cursor's column from the start
+        self.column_dt = column_dt  # how much time each column covers
+        self.head_time = None       # when the cursor column starts
         self.texture1 = gl_program.GLUniform()  # which texture core to use
-        self.usingA = True                      # which buffer are we using
         super(SlideProgram, self).__init__()
 
     def vertex_shader(self):
@@ -38,45 +65,16 @@ class SlideProgram(gl_program.GLProgram):
             """
 
     def initialize(self):
-        # create the textures
-        self.textureA = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureA)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
-                           gl.GL_NEAREST)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
-                           gl.GL_NEAREST) 
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
-                           gl.GL_CLAMP_TO_EDGE)  # don't wrap around
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T,
-                           gl.GL_CLAMP_TO_EDGE)  # don't wrap around
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA,
-                           self.width, self.height, 0,
-                           gl.GL_RGBA, gl.GL_UNSIGNED_SHORT, None)
-
-
-        self.textureB = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureB)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
-                           gl.GL_NEAREST)
-        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
-                           gl.GL_NEAREST)
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
-                           gl.GL_CLAMP_TO_EDGE)
-        gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T,
-                           gl.GL_CLAMP_TO_EDGE)
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA,
-                           self.width, self.height, 0,
-                           gl.GL_RGBA, gl.GL_UNSIGNED_SHORT, None)
-
-
-        # create the frame buffers
-        self.fbA = gl.glGenFramebuffers(1)
-        self.fbB = gl.glGenFramebuffers(1)
-
-        self.swap_frame_buffer(slide=0)
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT);
-        self.swap_frame_buffer(slide=0)
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT);
+        # create the textures and their frame buffers
+        self.target = render_target.PingPongTarget(
+            self.width, self.height, self.internal_format,
+            count=1 if self.ring else 2)
+        self.target.clear()
+        if self.ring:
+            # so it can be drawn starting from any column
+            gl.glBindTexture(gl.GL_TEXTURE_2D, self.target.current)
+            gl.glTexParameterf(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S,
+                               gl.GL_REPEAT)
 
         # create a convenient square for rendering
         # data is in (x, y, z, u, v) format
@@ -93,25 +91,70 @@ class SlideProgram(gl_program.GLProgram):
 
     def swap_frame_buffer(self, slide=1, swap=True):
         """Switch buffers so we alternate which one we're rendering to."""
-        if swap:
-            self.usingA = not self.usingA
-
-        if self.usingA:
-            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbA);
-            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER,
-                  gl.GL_COLOR_ATTACHMENT0,
-                  gl.GL_TEXTURE_2D, self.textureA, 0);
-        else:
-            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.fbB);
-            gl.glFramebufferTexture2D(gl.GL_FRAMEBUFFER,
-                  gl.GL_COLOR_ATTACHMENT0,
-                  gl.GL_TEXTURE_2D, self.textureB, 0);
-
-        # reset the geometry so we render to the whole image
-        gl.glViewport(-slide, 0, self.width, self.height)
+        if self.ring:
+            # the texture stays put, and the cursor moves instead
+            self.advance(slide)
+            self.target.bind()
+            return
 
+        if swap:
+            self.target.swap()
+        self.head_column += slide
+
+        # render to the whole image, shifted left by the slide
+        self.target.bind(x=-slide)
+
+
+    def advance(self, columns):
+        """Move the cursor on in ring mode, clearing the new columns."""
+        if columns <= 0:
+            return
+        cleared = min(columns, self.width)
+        if self.history is not None:
+            # save what was in the columns a lap ago
+            self.history.evict(self.target.frame_buffers[0],
+                               self.head_column + 1 - self.width, cleared)
+        start = (self.cursor + 1) % self.width
+        end = start + cleared
+        rects = [(start, 0, min(end, self.width) - start, self.height)]
+        if end > self.width:
+            rects.append((0, 0, end - self.width, self.height))
+        self.target.clear(rects)
+        self.cursor = (self.cursor + columns) % self.width
+        self.head_column += columns
+
+    def scroll_to(self, now):
+        """Slide along so that time now falls in the cursor column.
+
+        Returns the number of columns slid by.  Time going backwards
+        doesn't slide at all.
+        """
+        if self.head_time is None:
+            self.head_time = now
+            return 0
+        columns = int(np.floor((now - self.head_time) / self.column_dt))
+        if columns <= 0:
+            return 0
+        # move on by whole columns, so the leftover fraction is kept
+        self.head_time += columns * self.column_dt
+        self.swap_frame_buffer(columns)
+        self.paint_slid()
+        return columns
+
+    def texture_offset(self):
+        """How far to shift the texture by when drawing it.
+
+        This is for DrawTextureProgram.paint, and puts the cursor at the
+        right hand edge in ring mode.
+        """
+        if self.ring:
+            return (self.cursor + 1.0) / self.width
+        return 0.0
 
     def paint_slid(self):
+        if self.ring:
+            return      # nothing to copy
+
         gl.glClear(gl.GL_COLOR_BUFFER_BIT);
 
         # activate the program and set parameters
@@ -121,10 +164,7 @@ class SlideProgram(gl_program.GLProgram):
         # set up the texture to map
         gl.glEnable(gl.GL_TEXTURE_2D)
         gl.glActiveTexture(gl.GL_TEXTURE0)
-        if self.usingA:
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureB)
-        else:
-            gl.glBindTexture(gl.GL_TEXTURE_2D, self.textureA)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.target.previous)
 
 
         # a simple square filling the whole view
@@ -147,8 +187,5 @@ class SlideProgram(gl_program.GLProgram):
 
     def get_current_texture(self):
         """Helper function to get a handle to the active texture."""
-        if self.usingA:
-            return self.textureA
-        else:
-            return self.textureB
+        return self.target.current
 
@@ -1,38 +1,119 @@
+import ctypes
+
+import numpy as np
 import OpenGL.GL as gl
 import OpenGL.arrays.vbo as glvbo
 
+import buffers
 import gl_program
+import scatter
+
+
+# the GL element type to use for each kind of index array
+INDEX_TYPES = {
+    np.dtype('uint8'): gl.GL_UNSIGNED_BYTE,
+    np.dtype('uint16'): gl.GL_UNSIGNED_SHORT,
+    np.dtype('uint32'): gl.GL_UNSIGNED_INT,
+    }
+
+# the GL attribute type to use for each kind of spike weight array
+WEIGHT_TYPES = {
+    np.dtype('float32'): gl.GL_FLOAT,
+    np.dtype('uint8'): gl.GL_UNSIGNED_BYTE,
+    np.dtype('uint16'): gl.GL_UNSIGNED_SHORT,
+    }
+
+
+def index_dtype(n_neurons):
+    """The smallest dtype that can index the given number of neurons."""
+    if n_neurons <= 1 << 8:
+        return np.uint8
+    elif n_neurons <= 1 << 16:
+        return np.uint16
+    else:
+        return np.uint32
+
+
+def grid_layout(width, height):
+    """Pixel positions of neurons laid out row by row on a grid."""
+    index = np.arange(width * height)
+    return np.array([index % width, index // width], dtype='f').T
+
+
+def encode_tiles(data, tile_size=256):
+    """Split neuron indexes into tile-relative uint8 chunks.
+
+    Returns a list of (offset, indexes) pairs, where offset is the index
+    of the first neuron in the tile, ready to be passed to paint_spikes.
+    """
+    data = np.sort(data)
+    tiles = data // tile_size
+    starts = np.flatnonzero(np.diff(tiles)) + 1
+    tiles = [(int(t[0] // tile_size) * tile_size, t)
+             for t in np.split(data, starts) if len(t) > 0]
+    return [(base, (t - base).astype(np.uint8)) for base, t in tiles]
 
 
 class SpikeProgram(gl_program.GLProgram):
-    """Render a series of ints as white dots."""
+    """Render a series of ints as white dots.
+
+    Each neuron has a fixed position in the grid, given by the layout
+    (an array of (x, y) pixel positions, one row per neuron).  The
+    positions are uploaded once and the spikes are drawn by using their
+    indexes as an element buffer into that table.
 
-    def __init__(self, width, height):
+    Spikes can also carry a weight (e.g. an amplitude, or a spike count
+    when several steps are aggregated), which is added to the target
+    instead of 1.  Use a float target (e.g. a FadeProgram with
+    internal_format=GL_RGBA32F) so the sums are not clamped at 1.
+
+    Every paint method also takes a timestamp.  If it is given, the alpha
+    of each spiked texel is set to it (keeping the latest), which is what
+    a FadeProgram in lazy mode needs to work out the decay when drawing.
+    """
+
+    def __init__(self, width, height, layout=None, dense_threshold=0.1,
+                 persistent=False, backend='points', tiles=None,
+                 blend_alpha=False):
         self.width = width      # size of the grid
         self.height = height    # size of the grid
+        # stream spikes through a persistently mapped buffer, if we can
+        self.persistent = persistent
+        # how to draw lists of spikes: 'points' draws them as GL_POINTS,
+        # 'compute' and 'compute_binary' scatter them with a compute shader
+        self.backend = backend
+        if layout is None:
+            layout = grid_layout(width, height)
+        self.positions = np.asarray(layout, dtype='f')  # where each neuron is
+        self.n_neurons = len(self.positions)
+        # fraction of active neurons above which we upload the whole
+        # spike vector rather than a list of indexes
+        self.dense_threshold = dense_threshold
+        # a TileTracker to mark the tiles that get spikes, if any
+        self.tiles = tiles
+        # add spikes (of brightness scale) to the alpha channel as well,
+        # for when it is faded as a fourth channel
+        self.blend_alpha = blend_alpha
         self.scale = gl_program.GLUniform()     # brightness of spike
         super(SpikeProgram, self).__init__()
 
+    @property
+    def index_dtype(self):
+        """The most compact index dtype that covers all the neurons."""
+        return index_dtype(self.n_neurons)
+
     def vertex_shader(self):
         return """#version 330
 
-            // receive data using the vec2 called position
+            // the position of the neuron, already inside (-1, 1)
             layout(location = 0) in vec2 position;
 
             void main()
             {
-                // compute x, y indexes
-                int x = int(position.x / %(width)d);
-                int y = int(position.x - (x*%(width)d) + 1);
-
-                // covert to a point inside (-1, 1)
-                float xx = (x - %(width)d / 2) * 2.0 / %(width)d;
-                float yy = (y - %(height)d / 2) * 2.0 / %(height)d;
-
                 // return the final location of the spike
-                gl_Position = vec4(xx, yy, 0., 1);
+                gl_Position = vec4(position, 0., 1);
             }
-            """ % dict(width=self.width, height=self.height)
+            """
 
     def fragment_shader(self):
         return """#version 330
@@ -46,31 +127,688 @@ class SpikeProgram(gl_program.GLProgram):
             }
             """
 
-    def paint_spikes(self, data, scale=1.0):
-        """Render the given array of neuron indexes."""
+    def initialize(self):
+        # a single buffer reused for streaming the spikes every frame
+        self.buffer = buffers.create_stream_buffer(
+            target=gl.GL_ELEMENT_ARRAY_BUFFER, persistent=self.persistent)
+
+        # the static table of neuron positions, which can also be read
+        # as a buffer texture by programs that don't use it as vertices
+        self.layout = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.layout)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.n_neurons * 2 * 4, None,
+                        gl.GL_STATIC_DRAW)
+        self.layout_texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, self.layout_texture)
+        gl.glTexBuffer(gl.GL_TEXTURE_BUFFER, gl.GL_RG32F, self.layout)
+
+        # programs for drawing spikes that each carry a weight, for
+        # drawing whole spike vectors on busy frames (which needs a table
+        # the size of the grid), and for generating fake spikes on the
+        # GPU, all made when needed
+        self.weighted = None
+        self.dense = None
+        self.synthetic = None
+
+        # program for the compute shader backend
+        self.scatter = None
+        self.set_backend(self.backend)
+
+        self.set_layout(self.positions)
+
+    def set_backend(self, backend):
+        """Choose how lists of spikes are drawn (see __init__)."""
+        if backend not in ('points', 'compute', 'compute_binary'):
+            raise ValueError('Unknown backend %r' % backend)
+        self.backend = backend
+        if backend != 'points':
+            binary = backend == 'compute_binary'
+            if self.scatter is None or self.scatter.binary != binary:
+                self.scatter = scatter.ScatterProgram(self.width,
+                                                      self.height,
+                                                      binary=binary)
+                self.scatter.link()
+
+    def set_layout(self, positions):
+        """Move the neurons to the given (x, y) pixel positions."""
+        positions = np.asarray(positions, dtype='f')
+        if len(positions) != self.n_neurons:
+            raise ValueError('Layout has %d neurons, expected %d' %
+                             (len(positions), self.n_neurons))
+        self.positions = positions
 
-        # convert the data to a VBO
-        vbo = glvbo.VBO(data)
-        vbo.bind()
+        # store the centre of each pixel, converted to (-1, 1)
+        size = np.array([self.width, self.height], dtype='f')
+        table = (positions + 0.5) * (2.0 / size) - 1.0
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.layout)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, table.astype('f'),
+                        gl.GL_STATIC_DRAW)
 
-        # tell OpenGL that the VBO contains an array of vertices
+        if self.dense is not None:
+            self.dense.set_layout(positions)
+        if self.tiles is not None:
+            self.tiles.set_layout(positions)
+
+    def get_weighted(self):
+        """The WeightedSpikeProgram, made the first time it is needed."""
+        if self.weighted is None:
+            self.weighted = WeightedSpikeProgram()
+            self.weighted.link()
+        return self.weighted
+
+    def get_dense(self):
+        """The DenseSpikeProgram, made the first time it is needed."""
+        if self.dense is None:
+            self.dense = DenseSpikeProgram(self.width, self.height,
+                                           self.n_neurons)
+            self.dense.link()
+            self.dense.set_layout(self.positions)
+        return self.dense
+
+    def paint_vector(self, x, scale=1.0, timestamp=None):
+        """Render a vector with one entry per neuron (non-zero = spike).
+
+        Depending on how many neurons spiked this either draws the list
+        of indexes as points or uploads the whole vector as a bitmask.
+        Returns the number of spikes drawn.
+        """
+        count = np.count_nonzero(x)
+        if count > self.dense_threshold * len(x):
+            self.get_dense().paint_dense(x,
+                                         scale=self.blend(scale, timestamp))
+            gl.glDisable(gl.GL_BLEND)
+            if self.tiles is not None:
+                self.tiles.mark_vector(x)
+        elif count > 0:
+            self.paint_spikes(np.flatnonzero(x).astype(self.index_dtype),
+                              scale=scale, timestamp=timestamp)
+        return count
+
+    def set_rate_map(self, rates):
+        """Set the firing rate (Hz) of each neuron for paint_synthetic.
+
+        rates can be a single rate for all neurons or one per neuron.
+        """
+        if self.synthetic is None:
+            self.synthetic = SyntheticSpikeProgram(self.n_neurons)
+            self.synthetic.link()
+        self.synthetic.set_rate_map(rates)
+
+    def paint_synthetic(self, dt, scale=1.0, timestamp=None):
+        """Render dt seconds of Poisson spikes generated on the GPU.
+
+        This is for load testing the fade and draw path without the cost
+        of generating and uploading spikes.  Returns the number of spikes
+        generated, which is read back a frame late so as not to stall.
+        """
+        if self.synthetic is None:
+            self.set_rate_map(10.0)
+
+        # one vertex per neuron, straight out of the layout table
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.layout)
         gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+
+        count = self.synthetic.paint_synthetic(
+            dt, scale=self.blend(scale, timestamp))
+        gl.glDisable(gl.GL_BLEND)
+        if self.tiles is not None:
+            self.tiles.mark_all()   # we don't know where they were
+        return count
+
+    def paint_spikes_batch(self, chunks, step_times, now=None, tau=1.0,
+                           scale=1.0, timestamp=None):
+        """Render several time steps worth of spikes in one draw call.
+
+        chunks is a list of index arrays, one per step, and step_times
+        gives the time of each step.  Each spike is weighted by
+        exp(-(now - step_time) / tau), which matches what fading by
+        exp(-dt / tau) after every step would have produced.  As with
+        FadeProgram, tau can be up to four time constants, one for each
+        channel.  now defaults to the latest step time.  Returns the
+        number of spikes.
+
+        With a timestamp (which should then be now), each spike is
+        instead stamped with the time of its own step and left unfaded,
+        since the fading is then worked out from the stamps.
+        """
+        if now is None:
+            now = max(step_times)
+        lengths = [len(c) for c in chunks]
+        if sum(lengths) == 0:
+            return 0
+        data = np.concatenate([self.as_indexes(c) for c in chunks])
+        ages = np.repeat((now - np.asarray(step_times)).astype('f'), lengths)
+        if timestamp is not None:
+            tau = 1e30      # so exp(-age / tau) is 1
+        scale = self.blend(scale, timestamp)
+        self.get_weighted().paint_weighted(self.buffer, self.layout_texture,
+                                           self.as_indexes(data), ages=ages,
+                                           tau=tau, scale=scale,
+                                           stamp=timestamp is not None)
+        gl.glDisable(gl.GL_BLEND)
+        if self.tiles is not None:
+            self.tiles.mark(data)
+        return len(data)
+
+    def as_indexes(self, data):
+        """Return the data as an index array GL can read directly."""
+        data = np.asarray(data)
+        if data.dtype == np.int32:
+            data = data.view(np.uint32)     # same bits, no copy needed
+        if data.dtype not in INDEX_TYPES:
+            data = data.astype(self.index_dtype)
+        return data
+
+    def blend(self, scale, timestamp=None):
+        """Set up blending for spikes and return the alpha to draw with.
+
+        Normally spikes add onto the colour and leave the alpha alone, or
+        add scale to it if blend_alpha is set.  If a timestamp is given,
+        each spike replaces the colour instead (the old value having
+        faded by an unknown amount) and the alpha becomes the larger of
+        its old value and the timestamp.
+        """
+        gl.glEnable(gl.GL_BLEND)
+        if timestamp is None:
+            gl.glBlendEquationSeparate(gl.GL_FUNC_ADD, gl.GL_FUNC_ADD)
+            if self.blend_alpha:
+                gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE)
+            else:
+                gl.glBlendFuncSeparate(gl.GL_ONE, gl.GL_ONE,
+                                       gl.GL_ZERO, gl.GL_ONE)
+        else:
+            # GL_MAX ignores the blend factors, so the alpha is the latest
+            gl.glBlendEquationSeparate(gl.GL_FUNC_ADD, gl.GL_MAX)
+            gl.glBlendFuncSeparate(gl.GL_ONE, gl.GL_ZERO,
+                                   gl.GL_ONE, gl.GL_ONE)
+            scale = timestamp
+        return scale
+
+    def paint_spikes(self, data, scale=1.0, offset=0, weights=None,
+                     timestamp=None):
+        """Render the given array of neuron indexes.
+
+        The indexes are uploaded as they are if they are uint8, uint16 or
+        uint32, so passing the smallest type that fits (see index_dtype)
+        cuts the upload size.  The offset is added to every index, which
+        allows tile-relative uint8 indexes (see encode_tiles).
+
+        If weights are given (float32, uint8 or uint16, one per spike),
+        each spike adds its weight to the target rather than 1.
+        """
+
+        data = self.as_indexes(data)
+        scale = self.blend(scale, timestamp)
+        if weights is not None:
+            self.get_weighted().paint_weighted(
+                self.buffer, self.layout_texture, data, weights,
+                scale=scale, offset=offset, stamp=timestamp is not None)
+        elif self.backend != 'points':
+            self.scatter.paint_spikes(self.buffer, self.layout_texture,
+                                      data, scale=scale, offset=offset)
+        else:
+            self.paint_points(data, scale=scale, offset=offset)
+        gl.glDisable(gl.GL_BLEND)
+        if self.tiles is not None:
+            self.tiles.mark(data, offset)
 
-        # array is a list of unsigned ints
-        gl.glVertexAttribPointer(0, 1, gl.GL_UNSIGNED_INT,
-                                 gl.GL_FALSE, 0, None)
+    def paint_points(self, data, scale=1.0, offset=0):
+        """Draw an index array as points, with the blending already set."""
+        gl_type = INDEX_TYPES[data.dtype]
+
+        # copy the data into the streaming element buffer
+        buffer_offset = self.buffer.write(data)
+
+        # the vertices are the static table of neuron positions
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.layout)
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
 
         # activate the program
         gl.glUseProgram(self.program)
         gl.glUniform1f(self.scale, scale)
 
-        gl.glEnable(gl.GL_BLEND)
-        gl.glBlendEquationSeparate(gl.GL_FUNC_ADD, gl.GL_FUNC_ADD)
-        gl.glBlendFuncSeparate(gl.GL_ONE, gl.GL_ONE, 
-                               gl.GL_ZERO, gl.GL_ONE)
+        # draw the spikes, looking each index up in the position table
+        gl.glDrawElementsBaseVertex(gl.GL_POINTS, len(data), gl_type,
+                                    self.buffer.pointer(buffer_offset),
+                                    offset)
 
-        # draw the spikes
-        gl.glDrawArrays(gl.GL_POINTS, 0, len(data))
+
+class EnsembleSpikeProgram(SpikeProgram):
+    """Render the spikes of many ensembles with a single draw call.
+
+    Each ensemble gets its own (x, y, width, height) rectangle of one
+    shared texture, with its neurons laid out row by row inside it.  All
+    the layouts are concatenated into one table, so the per-ensemble
+    origins are baked into the positions, and each ensemble's first
+    entry in that table is used as its base vertex.  A frame's worth of
+    spikes is then uploaded together and drawn with one
+    glMultiDrawElementsBaseVertex call.
+    """
+
+    def __init__(self, width, height, rects, **kwargs):
+        self.rects = rects
+        layouts = [grid_layout(w, h) + [x, y] for x, y, w, h in rects]
+        sizes = [len(layout) for layout in layouts]
+        # index of each ensemble's first neuron in the combined table
+        self.base = np.cumsum([0] + sizes[:-1]).astype(np.int32)
+        super(EnsembleSpikeProgram, self).__init__(
+            width, height, layout=np.concatenate(layouts), **kwargs)
+
+    def paint_ensembles(self, spikes, scale=1.0, timestamp=None):
+        """Render a list of (ensemble_id, neuron indexes) pairs.
+
+        The indexes are relative to each ensemble.  Returns the number
+        of spikes drawn.
+        """
+        spikes = [(e, self.as_indexes(d)) for e, d in spikes if len(d) > 0]
+        if len(spikes) == 0:
+            return 0
+        data = np.concatenate([d for e, d in spikes])
+        gl_type = INDEX_TYPES[data.dtype]
+
+        # one upload for everything, then work out where each ensemble's
+        # spikes start
+        counts = np.array([len(d) for e, d in spikes], dtype=np.int32)
+        buffer_offset = self.buffer.write(data)
+        starts = buffer_offset + data.itemsize * np.cumsum(
+            np.concatenate([[0], counts[:-1]]))
+        pointers = (ctypes.c_void_p * len(spikes))(*[int(s) for s in starts])
+        base = self.base[[e for e, d in spikes]]
+
+        # the vertices are the static table of neuron positions
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.layout)
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+
+        # activate the program
+        gl.glUseProgram(self.program)
+        gl.glUniform1f(self.scale, self.blend(scale, timestamp))
+
+        # draw every ensemble, each offset into its part of the table
+        gl.glMultiDrawElementsBaseVertex(gl.GL_POINTS, counts, gl_type,
+                                         pointers, len(spikes), base)
 
         gl.glDisable(gl.GL_BLEND)
+        if self.tiles is not None:
+            self.tiles.mark(data, np.repeat(base, counts))
+
+        return len(data)
+
+
+class WeightedSpikeProgram(gl_program.GLProgram):
+    """Render neuron indexes as dots with a brightness given per spike.
+
+    Since the weights belong to the spikes rather than the neurons, the
+    spikes are drawn as an array of (index, weight, age) vertices and the
+    positions are read from the layout table through a buffer texture.
+    Each spike adds weight * exp(-age / tau) to the target, with tau
+    given for each channel.  The alpha gets scale * exp(-age / tau), or
+    when stamping, the time of the spike's own step (scale being the
+    latest step time).
+    """
+
+    def __init__(self):
+        self.positions = gl_program.GLUniform()  # the neuron layout table
+        self.offset = gl_program.GLUniform()     # added to every index
+        self.scale = gl_program.GLUniform()      # brightness of spike
+        self.tau = gl_program.GLUniform()        # decay time for the ages
+        self.stamp = gl_program.GLUniform()      # alpha holds spike times
+        super(WeightedSpikeProgram, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 330
+
+            layout(location = 0) in uint index;
+            layout(location = 1) in float weight;
+            layout(location = 2) in float age;
+            uniform samplerBuffer positions;
+            uniform int offset;
+            uniform vec4 tau;
+            flat out vec4 spike_fade;
+            flat out float spike_weight;
+            flat out float spike_age;
+
+            void main()
+            {
+                // look up where this neuron is
+                vec2 p = texelFetch(positions, int(index) + offset).xy;
+                gl_Position = vec4(p, 0., 1.);
+
+                // older spikes have already faded a bit
+                spike_fade = exp(-age / tau);
+                spike_weight = weight;
+                spike_age = age;
+            }
+            """
+
+    def fragment_shader(self):
+        return """#version 330
+            flat in vec4 spike_fade;
+            flat in float spike_weight;
+            flat in float spike_age;
+            out vec4 out_color;
+            uniform float scale;
+            uniform bool stamp;
+
+            void main()
+            {
+                // draw a dot as bright as the weight, with the alpha
+                // either faded the same way or going back to the time
+                // of the spike's own step
+                float alpha = stamp ? scale - spike_age
+                                    : scale * spike_fade.a;
+                out_color = vec4(spike_weight * spike_fade.rgb, alpha);
+            }
+            """
+
+    def paint_weighted(self, buffer, positions, data, weights=None,
+                       ages=None, tau=1.0, scale=1.0, offset=0,
+                       stamp=False):
+        """Render the spikes in data, each adding its faded weight.
+
+        Missing weights count as 1 and missing ages as 0.  tau can be up
+        to four time constants, padded out with the last one as in
+        FadeProgram.  If stamp is set, scale is the latest step time and
+        each spike's alpha is the time of its own step.
+        """
+        arrays = [data]
+        if weights is not None:
+            weights = np.asarray(weights)
+            if weights.dtype not in WEIGHT_TYPES:
+                weights = weights.astype('f')
+            arrays.append(weights)
+        if ages is not None:
+            ages = np.asarray(ages, dtype='f')
+            arrays.append(ages)
+
+        # upload the arrays together so they can't be orphaned apart
+        buffer.reserve(sum(a.nbytes + 4 for a in arrays))
+        offsets = [buffer.write(a) for a in arrays]
+
+        # everything is read as vertex attributes
+        buffer.bind(gl.GL_ARRAY_BUFFER)
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribIPointer(0, 1, INDEX_TYPES[data.dtype], 0,
+                                  buffer.pointer(offsets.pop(0)))
+        if weights is not None:
+            gl.glEnableVertexAttribArray(1)
+            gl.glVertexAttribPointer(1, 1, WEIGHT_TYPES[weights.dtype],
+                                     gl.GL_FALSE, 0,
+                                     buffer.pointer(offsets.pop(0)))
+        else:
+            gl.glVertexAttrib1f(1, 1.0)
+        if ages is not None:
+            gl.glEnableVertexAttribArray(2)
+            gl.glVertexAttribPointer(2, 1, gl.GL_FLOAT, gl.GL_FALSE, 0,
+                                     buffer.pointer(offsets.pop(0)))
+        else:
+            gl.glVertexAttrib1f(2, 0.0)
+
+        # the positions come from the layout table
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, positions)
+
+        # activate the program
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.positions, 0)   # indicate we use GL_TEXTURE0
+        gl.glUniform1i(self.offset, offset)
+        gl.glUniform1f(self.scale, scale)
+        gl.glUniform4f(self.tau, *gl_program.channel_taus(tau))
+        gl.glUniform1i(self.stamp, stamp)
+
+        gl.glDrawArrays(gl.GL_POINTS, 0, len(data))
+
+        gl.glDisableVertexAttribArray(1)
+        gl.glDisableVertexAttribArray(2)
+
+
+class SyntheticSpikeProgram(gl_program.GLProgram):
+    """Generate Poisson spikes in the vertex shader.
+
+    Every neuron is drawn as a point, and a hash of its index and the
+    frame number decides whether it spiked, with probability
+    1 - exp(-rate * dt).  Neurons that didn't spike are moved outside
+    the viewport.  An occlusion query counts the spikes that were drawn.
+    """
+
+    def __init__(self, n_neurons):
+        self.n_neurons = n_neurons
+        self.rates = gl_program.GLUniform()     # firing rate of each neuron
+        self.dt = gl_program.GLUniform()        # time covered by this frame
+        self.seed = gl_program.GLUniform()      # changes every frame
+        self.scale = gl_program.GLUniform()     # brightness of spike
+        self.frame = 0
+        super(SyntheticSpikeProgram, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 330
+
+            layout(location = 0) in vec2 position;
+            uniform samplerBuffer rates;
+            uniform float dt;
+            uniform uint seed;
+
+            // integer hash (from the PCG family) giving a uniform uint
+            uint hash(uint v)
+            {
+                uint state = v * 747796405u + 2891336453u;
+                uint word = ((state >> ((state >> 28u) + 4u)) ^ state)
+                            * 277803737u;
+                return (word >> 22u) ^ word;
+            }
+
+            void main()
+            {
+                // a uniform random number in [0, 1) for this neuron
+                uint h = hash(uint(gl_VertexID) ^ hash(seed));
+                float u = float(h) * (1.0 / 4294967296.0);
+
+                float rate = texelFetch(rates, gl_VertexID).r;
+                if (u < 1.0 - exp(-rate * dt)) {
+                    gl_Position = vec4(position, 0., 1.);
+                } else {
+                    // no spike, so put the point where it gets clipped
+                    gl_Position = vec4(2., 2., 2., 1.);
+                }
+            }
+            """
+
+    def fragment_shader(self):
+        return """#version 330
+            out vec4 out_color;
+            uniform float scale;
+
+            void main()
+            {
+                // draw a white dot
+                out_color = vec4(1., 1., 1., scale);
+            }
+            """
+
+    def initialize(self):
+        # the rate map, read as a buffer texture
+        self.rate_buffer = gl.glGenBuffers(1)
+        self.rate_texture = gl.glGenTextures(1)
+
+        # queries for counting the spikes, used alternately so we can
+        # read last frame's result without waiting for this frame's
+        self.queries = gl.glGenQueries(2)
+        self.count = 0
+
+    def set_rate_map(self, rates):
+        """Set the firing rate (Hz) of every neuron."""
+        rates = np.asarray(rates, dtype='f')
+        if rates.ndim == 0:
+            rates = np.full(self.n_neurons, rates, dtype='f')
+        if len(rates) != self.n_neurons:
+            raise ValueError('Rate map has %d neurons, expected %d' %
+                             (len(rates), self.n_neurons))
+        gl.glBindBuffer(gl.GL_TEXTURE_BUFFER, self.rate_buffer)
+        gl.glBufferData(gl.GL_TEXTURE_BUFFER, rates, gl.GL_STATIC_DRAW)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, self.rate_texture)
+        gl.glTexBuffer(gl.GL_TEXTURE_BUFFER, gl.GL_R32F, self.rate_buffer)
+
+    def paint_synthetic(self, dt, scale=1.0):
+        """Render one frame of spikes; the vertices must already be set."""
+
+        # pick up the spike count from the last frame, if it's ready
+        previous = self.queries[(self.frame + 1) % 2]
+        if self.frame > 0 and gl.glGetQueryObjectuiv(
+                previous, gl.GL_QUERY_RESULT_AVAILABLE):
+            self.count = gl.glGetQueryObjectuiv(previous,
+                                                gl.GL_QUERY_RESULT)
+
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_BUFFER, self.rate_texture)
+
+        # activate the program
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.rates, 0)   # indicate we use GL_TEXTURE0
+        gl.glUniform1f(self.dt, dt)
+        gl.glUniform1ui(self.seed, self.frame)
+        gl.glUniform1f(self.scale, scale)
+
+        # draw every neuron, counting the ones that land on the grid
+        gl.glBeginQuery(gl.GL_SAMPLES_PASSED, self.queries[self.frame % 2])
+        gl.glDrawArrays(gl.GL_POINTS, 0, self.n_neurons)
+        gl.glEndQuery(gl.GL_SAMPLES_PASSED)
+
+        self.frame += 1
+        return self.count
+
+
+class DenseSpikeProgram(gl_program.GLProgram):
+    """Render a dense spike vector by unpacking it from a bitmask.
+
+    The vector is packed to one bit per neuron with np.packbits and
+    uploaded as an integer texture.  A full-grid pass then looks up which
+    neuron lives at each pixel and draws a white dot if its bit is set.
+    """
+
+    def __init__(self, width, height, n_neurons):
+        self.width = width      # size of the grid
+        self.height = height    # size of the grid
+        self.n_neurons = n_neurons
+        self.rows = (n_neurons + width - 1) // width    # rows of bits
+        self.row_bytes = (width + 7) // 8               # bytes per row
+        self.bits = gl_program.GLUniform()      # the packed spike texture
+        self.neurons = gl_program.GLUniform()   # neuron index at each pixel
+        self.scale = gl_program.GLUniform()     # brightness of spike
+        super(DenseSpikeProgram, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 330
+
+            layout(location = 0) in vec2 position;
+
+            void main()
+            {
+                // just cover the whole grid
+                gl_Position = vec4(position, 0., 1.);
+            }
+            """
+
+    def fragment_shader(self):
+        return """#version 330
+            out vec4 out_color;
+            uniform usampler2D bits;
+            uniform isampler2D neurons;
+            uniform float scale;
+
+            void main()
+            {
+                // work out which neuron lives at this pixel
+                int i = texelFetch(neurons, ivec2(gl_FragCoord.xy), 0).r;
+                if (i < 0) discard;
+
+                // pull its bit out of the packed texture (packbits puts
+                // the first neuron in the most significant bit)
+                int row = i / %(width)d;
+                int col = i - row * %(width)d;
+                uint byte = texelFetch(bits, ivec2(col / 8, row), 0).r;
+                if (((byte >> uint(7 - col %% 8)) & 1u) == 0u) discard;
+
+                // draw a white dot
+                out_color = vec4(1., 1., 1., scale);
+            }
+            """ % dict(width=self.width)
+
+    def initialize(self):
+        # an integer texture holding one bit per neuron
+        self.texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_R8UI,
+                        self.row_bytes, self.rows, 0,
+                        gl.GL_RED_INTEGER, gl.GL_UNSIGNED_BYTE, None)
+
+        # an integer texture giving the neuron at each pixel (-1 for none)
+        self.neuron_texture = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.neuron_texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER,
+                           gl.GL_NEAREST)
+
+        # a square covering the whole grid
+        self.square = glvbo.VBO(
+            np.array( [
+                [ -1,-1 ],
+                [  1,-1 ],
+                [  1, 1 ],
+                [ -1,-1 ],
+                [  1, 1 ],
+                [ -1, 1 ],
+            ],'f')
+        )
+
+    def set_layout(self, positions):
+        """Build the pixel -> neuron lookup for the given positions."""
+        x, y = np.floor(positions).astype(int).T
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        neurons = np.full((self.height, self.width), -1, dtype=np.int32)
+        neurons[y[inside], x[inside]] = np.flatnonzero(inside)
+
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.neuron_texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_R32I,
+                        self.width, self.height, 0,
+                        gl.GL_RED_INTEGER, gl.GL_INT, neurons)
+
+    def paint_dense(self, x, scale=1.0):
+        """Render a vector with one entry per neuron (non-zero = spike)."""
+
+        # lay the spikes out in rows and pack them to bits
+        spikes = np.zeros(self.rows * self.width, dtype=bool)
+        spikes[:len(x)] = x
+        packed = np.packbits(spikes.reshape(self.rows, self.width), axis=1)
+
+        # upload the bits
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.texture)
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexSubImage2D(gl.GL_TEXTURE_2D, 0, 0, 0,
+                           self.row_bytes, self.rows,
+                           gl.GL_RED_INTEGER, gl.GL_UNSIGNED_BYTE, packed)
+        gl.glActiveTexture(gl.GL_TEXTURE1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D, self.neuron_texture)
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+
+        # activate the program
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.bits, 0)        # indicate we use GL_TEXTURE0
+        gl.glUniform1i(self.neurons, 1)     # and GL_TEXTURE1
+        gl.glUniform1f(self.scale, scale)
+
+        # a simple square filling the whole grid
+        self.square.bind()
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
 
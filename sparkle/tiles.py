@@ -0,0 +1,92 @@
+import numpy as np
+
+
+class TileTracker(object):
+    """Keep track of which tiles of a plot still have something showing.
+
+    The plot is split into square tiles.  A SpikeProgram marks the tiles
+    its spikes land in, and a FadeProgram turns those marks into a time
+    each tile stays alive until, so it only has to fade the live tiles
+    and can clear the rest once, when they die.  With sparse activity on
+    a big grid this is a small fraction of the texture.
+    """
+    def __init__(self, width, height, tile_size=64):
+        self.width = width          # size of the grid
+        self.height = height        # size of the grid
+        self.tile_size = tile_size
+        self.columns = (width + tile_size - 1) // tile_size
+        self.rows = (height + tile_size - 1) // tile_size
+        n_tiles = self.rows * self.columns
+
+        # the tile each neuron is in
+        self.neuron_tiles = np.zeros(0, dtype=np.int32)
+        # which tiles have had spikes since the last update
+        self.touched = np.zeros(n_tiles, dtype=bool)
+        # when each tile will have faded out
+        self.alive_until = np.full(n_tiles, -np.inf)
+        # which tiles were alive at the last update
+        self.live = np.zeros(n_tiles, dtype=bool)
+
+    def set_layout(self, positions):
+        """Work out which tile each neuron is in from its pixel position."""
+        x, y = np.floor(positions).astype(int).T
+        x = np.clip(x // self.tile_size, 0, self.columns - 1)
+        y = np.clip(y // self.tile_size, 0, self.rows - 1)
+        self.neuron_tiles = (y * self.columns + x).astype(np.int32)
+
+    def mark(self, indexes, offset=0):
+        """Note that the given neurons have spiked."""
+        indexes = np.asarray(indexes, dtype=np.int64)
+        self.touched[self.neuron_tiles[indexes + offset]] = True
+
+    def mark_vector(self, x):
+        """Note the spikes in a vector with one entry per neuron."""
+        self.touched[self.neuron_tiles[np.flatnonzero(x)]] = True
+
+    def mark_all(self):
+        """Note that there may be spikes anywhere."""
+        self.touched[:] = True
+
+    def update(self, now, lifetime):
+        """Work out which tiles are alive at time now.
+
+        Tiles marked since the last update stay alive until now +
+        lifetime.  Returns the live tiles and those that have died since
+        the last update, as arrays of tile ids.
+        """
+        self.alive_until[self.touched] = now + lifetime
+        self.touched[:] = False
+
+        live = self.alive_until >= now
+        died = np.flatnonzero(self.live & ~live)
+        self.live = live
+        return np.flatnonzero(live), died
+
+    def rects(self, tiles):
+        """The (x, y, width, height) pixel rectangle of each tile."""
+        x = (tiles % self.columns) * self.tile_size
+        y = (tiles // self.columns) * self.tile_size
+        w = np.minimum(x + self.tile_size, self.width) - x
+        h = np.minimum(y + self.tile_size, self.height) - y
+        return np.array([x, y, w, h], dtype=int).T
+
+    def quads(self, tiles):
+        """Two triangles covering each tile, as (x, y, z, u, v) vertices.
+
+        These are in the same format as the squares the programs draw to
+        cover the whole grid, so they can be drawn in their place.
+        """
+        x, y, w, h = self.rects(tiles).T
+        u0 = x / float(self.width)
+        u1 = (x + w) / float(self.width)
+        v0 = y / float(self.height)
+        v1 = (y + h) / float(self.height)
+        corners = [(u0, v0), (u1, v0), (u1, v1), (u0, v0), (u1, v1), (u0, v1)]
+
+        vertices = np.zeros((len(tiles), 6, 5), dtype='f')
+        for i, (u, v) in enumerate(corners):
+            vertices[:, i, 0] = u * 2 - 1
+            vertices[:, i, 1] = v * 2 - 1
+            vertices[:, i, 3] = u
+            vertices[:, i, 4] = v
+        return vertices.reshape(-1, 5)
@@ -0,0 +1,147 @@
+import numpy as np
+import OpenGL.GL as gl
+import OpenGL.arrays.vbo as glvbo
+
+import gl_program
+import render_target
+
+
+class WindowCountProgram(gl_program.GLProgram):
+    """Count the spikes in each texel over the last few frames, exactly.
+
+    Rather than fading, each frame's spikes are drawn into their own
+    layer of a texture array used as a ring of the last n_frames frames,
+    and a running sum of the layers is kept in a separate texture.  Each
+    frame the oldest layer is subtracted from the sum and cleared, the
+    new spikes are drawn into it, and it is added back to the sum, so the
+    cost per frame doesn't depend on the length of the window.  The sum
+    is then the number of spikes in the window, which can be drawn with
+    a gain of 1 / (the most spikes to show).
+
+    The default GL_R32F keeps counts exact up to 2**24.
+
+        window.begin_frame()
+        spiker.paint_spikes(data)
+        window.end_frame()
+        draw_texture.paint(window.get_current_texture(), gain=...)
+    """
+    def __init__(self, width, height, n_frames, internal_format=gl.GL_R32F):
+        self.width = width          # size of the grid
+        self.height = height        # size of the grid
+        self.n_frames = n_frames    # length of the window
+        self.internal_format = internal_format
+        self.head = 0               # the layer with the newest frame
+        self.layers = gl_program.GLUniform()    # the ring of frames
+        self.layer = gl_program.GLUniform()     # which frame to draw
+        super(WindowCountProgram, self).__init__()
+
+    def vertex_shader(self):
+        return """#version 330
+
+            layout(location = 0) in vec2 position;
+
+            void main()
+            {
+                // just cover the whole grid
+                gl_Position = vec4(position, 0., 1.);
+            }
+            """
+
+    def fragment_shader(self):
+        return """#version 330
+            uniform sampler2DArray layers;
+            uniform int layer;
+            out vec4 out_color;
+
+            void main()
+            {
+                // copy the texel from the given frame
+                out_color = texelFetch(layers,
+                                       ivec3(gl_FragCoord.xy, layer), 0);
+            }
+            """
+
+    def initialize(self):
+        # the ring of frames, each layer with its own frame buffer
+        self.ring = gl.glGenTextures(1)
+        gl.glBindTexture(gl.GL_TEXTURE_2D_ARRAY, self.ring)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D_ARRAY, gl.GL_TEXTURE_MIN_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D_ARRAY, gl.GL_TEXTURE_MAG_FILTER,
+                           gl.GL_NEAREST)
+        gl.glTexImage3D(gl.GL_TEXTURE_2D_ARRAY, 0, self.internal_format,
+                        self.width, self.height, self.n_frames, 0,
+                        gl.GL_RED, gl.GL_FLOAT, None)
+        self.frame_buffers = []
+        for i in range(self.n_frames):
+            frame_buffer = gl.glGenFramebuffers(1)
+            gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, frame_buffer)
+            gl.glFramebufferTextureLayer(gl.GL_FRAMEBUFFER,
+                                         gl.GL_COLOR_ATTACHMENT0,
+                                         self.ring, 0, i)
+            render_target.check_frame_buffer(frame_buffer)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+            self.frame_buffers.append(frame_buffer)
+
+        # the running sum of all the frames
+        self.total = render_target.PingPongTarget(
+            self.width, self.height, self.internal_format, count=1)
+        self.total.clear()
+
+        # a square covering the whole grid
+        self.square = glvbo.VBO(
+            np.array( [
+                [ -1,-1 ],
+                [  1,-1 ],
+                [  1, 1 ],
+                [ -1,-1 ],
+                [  1, 1 ],
+                [ -1, 1 ],
+            ],'f')
+        )
+
+    def paint_layer(self, layer, equation):
+        """Blend a frame onto the sum with the given blend equation."""
+        self.total.bind()
+
+        gl.glUseProgram(self.program)
+        gl.glUniform1i(self.layers, 0)     # indicate we use GL_TEXTURE0
+        gl.glUniform1i(self.layer, layer)
+        gl.glActiveTexture(gl.GL_TEXTURE0)
+        gl.glBindTexture(gl.GL_TEXTURE_2D_ARRAY, self.ring)
+
+        self.square.bind()
+        gl.glEnableVertexAttribArray(0)
+        gl.glVertexAttribPointer(0, 2, gl.GL_FLOAT, gl.GL_FALSE, 0, None)
+
+        gl.glEnable(gl.GL_BLEND)
+        gl.glBlendEquation(equation)
+        gl.glBlendFunc(gl.GL_ONE, gl.GL_ONE)
+
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
+
+        gl.glDisable(gl.GL_BLEND)
+        gl.glBlendEquation(gl.GL_FUNC_ADD)
+
+    def begin_frame(self):
+        """Drop the oldest frame and get ready to draw the newest.
+
+        Leaves the new frame's layer bound, for the spikes to be drawn.
+        """
+        self.head = (self.head + 1) % self.n_frames
+
+        # take the oldest frame off the sum (the sum minus the frame)
+        self.paint_layer(self.head, gl.GL_FUNC_REVERSE_SUBTRACT)
+
+        # and reuse its layer for the new frame
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.frame_buffers[self.head])
+        gl.glViewport(0, 0, self.width, self.height)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+
+    def end_frame(self):
+        """Add the newest frame onto the sum."""
+        self.paint_layer(self.head, gl.GL_FUNC_ADD)
+
+    def get_current_texture(self):
+        """The texture holding the spike counts over the window."""
+        return self.total.current